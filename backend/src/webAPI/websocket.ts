@@ -68,11 +68,19 @@ export default function createWebsocketRouter(
 
                 if (data.action === "update") {
                     if (!data.operation) throw new Error("Missing fields.");
-                    headSerialNum = (await historyManager.getHeadNode(req.user!.user_id))?.serial_num ?? 0;
+                    const head = await historyManager.getHeadNode(req.user!.user_id);
+                    headSerialNum = head?.serial_num ?? 0;
                     if (headSerialNum+1 !== data.expected_serial_num) {
                         historyLock.release(req.user!.user_id);
                         return; // maybe repetitive reception of the same operation
                     }
+                    // an operation sent in a window must follow the one before it,
+                    // which is dropped if another client went first
+                    if (data.expected_prev_hash !== undefined &&
+                            data.expected_prev_hash !== (head?.history_hash ?? "")) {
+                        historyLock.release(req.user!.user_id);
+                        return;
+                    }
 
                     operation = parseOperation(data.operation);
                 }
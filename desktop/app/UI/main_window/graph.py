@@ -42,6 +42,7 @@ class GraphicsNodeItem(QGraphicsObject):
         self.line_pen = QPen(context.settings_manager.get("graph/lineColor", type=QColor), context.settings_manager.get("graph/linePenWidth", type=float))
         self.text_pen = QPen(context.settings_manager.get("graph/textColor", type=QColor), context.settings_manager.get("graph/textPenWidth", type=float))
         self.fixed_nodewidth, self.fixed_nodeheight = calculate_node_boundary(self.data_node.name)
+        self.structure = node_structure(self.data_node)
 
         self.reminder_dot_size = context.settings_manager.get("graph/reminderDotSize", type=float)
         self.reminder_dot_spacing = context.settings_manager.get("graph/reminderDotSpacing", type=float)
@@ -165,6 +166,7 @@ class TreeGraphWidget(QWidget):
         self.main_layout.setContentsMargins(0, 0, 0, 0)
 
         self.loader.reloaded.connect(self.relayout_tree)
+        self.loader.changed.connect(self.refresh_nodes)
         self.reminder_service.edited.connect(self.relayout_tree)
         self.hightlight_node = self.loader.tree.root
 
@@ -176,6 +178,7 @@ class TreeGraphWidget(QWidget):
 
         # store the expand status of each node item, updated dynamically by signals sent from node items
         self.expand_status = {self.loader.tree.root.identity: True}
+        self.items: dict[str, GraphicsNodeItem] = {} # the items laid out, by node identity
         self.relayout_tree()
 
         context.settings_manager.settings_changed.connect(self.update_settings)
@@ -200,6 +203,7 @@ class TreeGraphWidget(QWidget):
         self.hightlight_node = self.shell.pwd_node
         # NODE_HEIGHT = context.settings_manager.get("graph/nodeHeight", type=float)
         self.scene.clear()
+        self.items = {}
 
         y_cursor = 0 # shared across all recursive calls
         def recursively_layout_tree(node, depth, prefix, is_last_child):
@@ -221,17 +225,19 @@ class TreeGraphWidget(QWidget):
                 self.expand_status[node.identity] = True
             reminders = self.reminder_service.get_reminders_by_node_id(node.identity)
             item = GraphicsNodeItem(node, prefix, is_expanded, calculate_reminder_type(reminders),
-                                    highlight=(node is self.hightlight_node))
+                                    highlight=(node == self.hightlight_node))
             item.request_add_reminder.connect(self.on_reminder_add)
             self.init_item(item)
             self.scene.addItem(item)
+            self.items[node.identity] = item
             item.setPos(x_pos, y_pos)
             y_cursor += fixed_nodeheight + V_SPACING
 
-            if is_expanded and node.children:
+            children = node.children
+            if is_expanded and children:
                 # recusively layout the children
-                for child in node.children:
-                    last_child = (child == node.children[-1])
+                for child in children:
+                    last_child = (child == children[-1])
                     new_prefix = prefix.copy()
                     if is_last_child and new_prefix:
                         new_prefix[-1] = 0
@@ -243,6 +249,24 @@ class TreeGraphWidget(QWidget):
         
         recursively_layout_tree(self.loader.tree.root, 0, list(), True)
     
+    def refresh_nodes(self, identities: list):
+        """
+        repaint the items of the nodes changed in place, or lay out the
+        tree again if the structure around them has changed
+        """
+        items = []
+        for identity in identities:
+            node = self.loader.tree.get_node_by_id(identity)
+            item = self.items.get(identity)
+            if node is None and item is None:
+                continue
+            if node is None or item is None or item.structure != node_structure(node):
+                self.relayout_tree()
+                return
+            items.append(item)
+        for item in items:
+            item.update()
+
     def change_expanded(self, node_item):
         self.expand_status[node_item.data_node.identity] = not self.expand_status[node_item.data_node.identity]
         self.relayout_tree()
@@ -266,6 +290,11 @@ def calculate_node_boundary(text: str) -> tuple[float,float] :
         )
     return (fixed_nodewidth, fixed_nodeheight)
 
+def node_structure(node: Node) -> tuple:
+    """what the layout of a node depends on, except its status"""
+    parent = None if node.parent is None else node.parent.identity
+    return (parent, node.name, tuple(child.identity for child in node.children))
+
 def calculate_reminder_type(reminders: list) -> tuple[int, int]:
     active = 0
     for reminder in reminders:
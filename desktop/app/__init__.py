@@ -41,7 +41,10 @@ class Application(QApplication):
         self.user_manager = UserManager(self.APP_ROOT / "user_datafile.txt")
         self.requester = Requester(self.user_manager, self.APP_ROOT / "requester_datafile.txt")
         self.database = Database(self.user_manager, self.APP_ROOT, "storage.db")
+        # commit what the group commit of database is still holding
+        self.aboutToQuit.connect(self.database.flush)
         self.syncer = Syncer(self.database, self.requester)
+        self.aboutToQuit.connect(self.syncer.stop)
         self.loader = TreeLoader(self.database, self.requester)
         self.reminder_service = ReminderService(self.user_manager, self.APP_ROOT, "reminder.txt")
         self.shell = Shell(self)
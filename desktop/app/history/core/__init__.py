@@ -2,4 +2,6 @@
 # also this submodule implements Tree
 
 from .operation import Operation, parse_operation, OperationType
-from .tree import Tree, Node, Status
\ No newline at end of file
+from .tree import Tree, Node, Status
+from .columnar_tree import ColumnarTree, ColumnarNode
+from .codec import encode_operation, decode_operation, canonical_form, StoredOperation
\ No newline at end of file
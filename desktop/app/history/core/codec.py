@@ -0,0 +1,131 @@
+# compact binary encoding of operations for the storage
+# the canonical form of an operation is always its JSON string (stringify),
+# from which history hashes are calculated; the binary encoding is only a
+# storage format, and an operation is stored in binary only when decoding
+# gives back exactly the same canonical form, otherwise it is stored as JSON
+#
+# layout (all integers big-endian):
+#   1 byte   format marker (JSON always starts with '{', so never confused)
+#   1 byte   operation type code
+#   8 bytes  timestamp, signed
+#   1 byte   bit i set when the i-th identity field is packed
+#   payload fields, in the order of PAYLOAD_FIELDS:
+#     identity: 16 bytes when packed (32 lowercase hex chars),
+#               otherwise the same as text
+#     text:     2 bytes length + UTF-8 bytes
+
+from typing import Optional, Union
+from .operation import Operation, OperationType, parse_operation
+import struct
+
+FORMAT_MARKER = 1
+HEADER = struct.Struct(">BBqB")
+TEXT_LENGTH = struct.Struct(">H")
+
+IDENTITY = 0
+TEXT = 1
+
+PAYLOAD_FIELDS: dict[OperationType, list[tuple[str, int]]] = {
+    OperationType.ADD_NODE: [("parent_node_id", IDENTITY), ("new_node_name", TEXT), ("new_node_id", IDENTITY)],
+    OperationType.REOPEN_NODE: [("node_id", IDENTITY)],
+    OperationType.COMPLETE_NODE: [("node_id", IDENTITY)],
+    OperationType.REMOVE_NODE: [("node_id", IDENTITY)],
+    OperationType.REMOVE_SUBTREE: [("node_id", IDENTITY)],
+    OperationType.MOVE_NODE: [("node_id", IDENTITY), ("new_parent_id", IDENTITY)],
+}
+TYPE_CODES = {op_type: code for code, op_type in enumerate(PAYLOAD_FIELDS)}
+CODE_TYPES = list(PAYLOAD_FIELDS)
+
+StoredOperation = Union[str, bytes]
+
+
+def pack_operation(operation: Operation) -> Optional[bytes]:
+    """
+    return the binary form; None when the operation can't be packed
+    """
+    fields = PAYLOAD_FIELDS[operation.op_type]
+    payload = operation.payload
+    if len(payload) != len(fields) or not isinstance(operation.timestamp, int) \
+            or not -2**63 <= operation.timestamp < 2**63:
+        return None
+
+    flags = 0
+    parts: list[bytes] = []
+    identity_index = 0
+    for key, kind in fields:
+        value = payload.get(key)
+        if not isinstance(value, str):
+            return None
+        if kind == IDENTITY:
+            if len(value) == 32:
+                try:
+                    packed = bytes.fromhex(value)
+                except ValueError:
+                    packed = None
+                if packed is not None and packed.hex() == value:
+                    flags |= 1 << identity_index
+                    parts.append(packed)
+                    identity_index += 1
+                    continue
+            identity_index += 1
+        encoded = value.encode("utf-8")
+        if len(encoded) >= 1 << 16:
+            return None
+        parts.append(TEXT_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+
+    return HEADER.pack(FORMAT_MARKER, TYPE_CODES[operation.op_type],
+                       operation.timestamp, flags) + b"".join(parts)
+
+
+def unpack_operation(data: bytes) -> Operation:
+    _, code, timestamp, flags = HEADER.unpack_from(data)
+    op_type = CODE_TYPES[code]
+    offset = HEADER.size
+    payload = {}
+    identity_index = 0
+    for key, kind in PAYLOAD_FIELDS[op_type]:
+        if kind == IDENTITY:
+            packed = flags & (1 << identity_index)
+            identity_index += 1
+            if packed:
+                payload[key] = data[offset:offset+16].hex()
+                offset += 16
+                continue
+        (length,) = TEXT_LENGTH.unpack_from(data, offset)
+        offset += TEXT_LENGTH.size
+        payload[key] = data[offset:offset+length].decode("utf-8")
+        offset += length
+    return Operation(op_type=op_type, payload=payload, timestamp=timestamp) # type: ignore
+
+
+def encode_operation(operation: Operation, compact: bool = False) -> StoredOperation:
+    """
+    encode an operation for the storage
+    :param compact: use the binary form when it keeps the canonical form
+    """
+    canonical = operation.stringify()
+    if compact:
+        packed = pack_operation(operation)
+        if packed is not None and unpack_operation(packed).stringify() == canonical:
+            return packed
+    return canonical
+
+
+def decode_operation(data: StoredOperation, trusted: bool = False) -> Optional[Operation]:
+    """
+    decode an operation from the storage, in either form
+    """
+    if isinstance(data, bytes):
+        return unpack_operation(data)
+    return parse_operation(data, trusted=trusted)
+
+
+def canonical_form(data: StoredOperation) -> str:
+    """
+    the canonical JSON string of a stored operation,
+    which is what we exchange with the server
+    """
+    if isinstance(data, bytes):
+        return unpack_operation(data).stringify()
+    return data
@@ -0,0 +1,427 @@
+# an array-backed variant of Tree for very large trees
+# nodes are stored as columns (int arrays for the links, lists for
+# identities and names, a bytearray for statuses) instead of one object
+# per node, and ColumnarNode is a lightweight view over one row,
+# offering the same interface as Node
+
+from array import array
+from typing import Optional, Iterator
+from .tree import Tree, Status, INITIAL_ID
+import sys, uuid
+
+NONE = -1 # no such node
+DETACHED = -2 # parent of a removed row, rows are never reused
+
+WAITING = 0
+COMPLETED = 1
+
+
+class ColumnarNode:
+    """
+    A view of a row in ColumnarTree, created on demand.
+    Two views are equal if they refer to the same row of the same tree.
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree: 'ColumnarTree', index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def identity(self) -> str:
+        return self.tree.identities[self.index]
+
+    @property
+    def name(self) -> str:
+        return self.tree.names[self.index]
+
+    @property
+    def status(self) -> Status:
+        return Status.COMPLETED if self.tree.statuses[self.index] == COMPLETED else Status.WAITING
+
+    @status.setter
+    def status(self, status: Status):
+        self.tree.set_status(self.index, COMPLETED if status == Status.COMPLETED else WAITING)
+
+    @property
+    def waiting_children(self) -> int:
+        return self.tree.waiting_children[self.index]
+
+    @property
+    def descendants(self) -> int:
+        return self.tree.descendants[self.index]
+
+    @property
+    def waiting_descendants(self) -> int:
+        return self.tree.waiting_descendants[self.index]
+
+    @property
+    def parent(self) -> Optional['ColumnarNode']:
+        parent = self.tree.parent[self.index]
+        if parent < 0:
+            return None
+        return ColumnarNode(self.tree, parent)
+
+    @property
+    def children(self) -> list['ColumnarNode']:
+        return [ColumnarNode(self.tree, child) for child in self.tree.iter_children(self.index)]
+
+    def addChild(self, child_node: 'ColumnarNode'):
+        self.tree.link(self.index, child_node.index)
+        self.tree.count_subtree(self.index, child_node.index, 1)
+
+    def removeChild(self, child_node: 'ColumnarNode'):
+        self.tree.count_subtree(self.index, child_node.index, -1)
+        self.tree.unlink(child_node.index)
+
+    def get_child(self, name: str) -> Optional['ColumnarNode']:
+        child = self.tree.child_index.get((self.index, name))
+        if child is None:
+            return None
+        return ColumnarNode(self.tree, child)
+
+    def is_ready(self):
+        return self.tree.waiting_children[self.index] == 0
+
+    def progress(self) -> Optional[float]:
+        """
+        the fraction of completed descendants, None if there is no descendant
+        """
+        descendants = self.tree.descendants[self.index]
+        if descendants == 0:
+            return None
+        return 1 - self.tree.waiting_descendants[self.index] / descendants
+
+    def row(self):
+        if self.tree.parent[self.index] < 0:
+            return 0
+        return self.tree.position[self.index]
+
+    def to_dict(self):
+        """
+        return a dict of the subtree
+        """
+        return {
+            'identity': self.identity,
+            'name': self.name,
+            'status': self.status.value,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnarNode) and \
+            other.tree is self.tree and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return f"Node({self.name}, {self.status})"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class ColumnarTree(Tree):
+    """
+    Tree whose nodes are stored in columns.
+    Each row holds parent, first child, last child, previous and
+    next sibling as ints, so that every link update is O(1).
+    Rows of removed nodes are detached but never reused, so that a
+    view held by someone never turns into another node.
+    The position among the siblings is a column too, and children are
+    indexed by (parent row, name) in a single dict.
+    The counters of waiting children, descendants and waiting
+    descendants are columns as well, maintained like those of Node.
+    It has the same public interface as Tree.
+    """
+    def __init__(self):
+        self.identities: list[str] = []
+        self.names: list[str] = []
+        self.statuses = bytearray()
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.last_child = array('i')
+        self.prev_sibling = array('i')
+        self.next_sibling = array('i')
+        self.position = array('i')
+        self.waiting_children = array('i')
+        self.descendants = array('i')
+        self.waiting_descendants = array('i')
+        # identity -> row of every node in the tree
+        self.node_index: dict[str, int] = {} # type: ignore[assignment]
+        # (parent row, name) -> row of every attached child
+        self.child_index: dict[tuple[int, str], int] = {}
+        self.append_row("WorkRoot", INITIAL_ID, WAITING)
+
+    @property
+    def root(self) -> ColumnarNode: # type: ignore[override]
+        return ColumnarNode(self, 0)
+
+    def append_row(self, name: str, identity: str, status: int) -> int:
+        index = len(self.identities)
+        identity = sys.intern(identity)
+        self.identities.append(identity)
+        self.names.append(name)
+        self.statuses.append(status)
+        for column in (self.parent, self.first_child, self.last_child,
+                       self.prev_sibling, self.next_sibling):
+            column.append(NONE)
+        for column in (self.position, self.waiting_children,
+                       self.descendants, self.waiting_descendants):
+            column.append(0)
+        self.node_index[identity] = index
+        return index
+
+    def iter_children(self, index: int) -> Iterator[int]:
+        child = self.first_child[index]
+        while child != NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def link(self, parent: int, child: int):
+        """
+        append child as the last child of parent
+        """
+        last = self.last_child[parent]
+        self.parent[child] = parent
+        self.prev_sibling[child] = last
+        self.next_sibling[child] = NONE
+        if last == NONE:
+            self.first_child[parent] = child
+            self.position[child] = 0
+        else:
+            self.next_sibling[last] = child
+            self.position[child] = self.position[last] + 1
+        self.last_child[parent] = child
+        self.child_index[(parent, self.names[child])] = child
+
+    def unlink(self, child: int):
+        parent = self.parent[child]
+        prev = self.prev_sibling[child]
+        following = self.next_sibling[child]
+        if prev == NONE:
+            self.first_child[parent] = following
+        else:
+            self.next_sibling[prev] = following
+        if following == NONE:
+            self.last_child[parent] = prev
+        else:
+            self.prev_sibling[following] = prev
+        # the following siblings move one position forward
+        curr = following
+        while curr != NONE:
+            self.position[curr] -= 1
+            curr = self.next_sibling[curr]
+        if self.child_index.get((parent, self.names[child])) == child:
+            del self.child_index[(parent, self.names[child])]
+        self.parent[child] = NONE
+        self.prev_sibling[child] = NONE
+        self.next_sibling[child] = NONE
+
+    def count_subtree(self, parent: int, child: int, sign: int):
+        """
+        add (sign=1) or subtract (sign=-1) the counters of the subtree
+        at child on parent and its ancestors
+        """
+        child_waiting = 1 if self.statuses[child] == WAITING else 0
+        total = sign * (self.descendants[child] + 1)
+        waiting = sign * (self.waiting_descendants[child] + child_waiting)
+        self.waiting_children[parent] += sign * child_waiting
+        curr = parent
+        while curr >= 0:
+            self.descendants[curr] += total
+            self.waiting_descendants[curr] += waiting
+            curr = self.parent[curr]
+
+    def set_status(self, index: int, status: int):
+        if self.statuses[index] == status:
+            return
+        self.statuses[index] = status
+        parent = self.parent[index]
+        if parent < 0:
+            return
+        delta = 1 if status == WAITING else -1
+        self.waiting_children[parent] += delta
+        curr = parent
+        while curr >= 0:
+            self.waiting_descendants[curr] += delta
+            curr = self.parent[curr]
+
+    def recount(self):
+        """
+        compute the counters of all rows from scratch
+        rows are visited backwards, which is bottom-up as long as
+        every child row comes after its parent row
+        """
+        for column in (self.waiting_children, self.descendants, self.waiting_descendants):
+            for i in range(len(column)):
+                column[i] = 0
+        for child in range(len(self.identities) - 1, 0, -1):
+            parent = self.parent[child]
+            if parent < 0:
+                continue
+            child_waiting = 1 if self.statuses[child] == WAITING else 0
+            self.waiting_children[parent] += child_waiting
+            self.descendants[parent] += self.descendants[child] + 1
+            self.waiting_descendants[parent] += self.waiting_descendants[child] + child_waiting
+
+    def has_child_named(self, index: int, name: str) -> bool:
+        return (index, name) in self.child_index
+
+    @classmethod
+    def from_dict(cls, data) -> 'ColumnarTree':
+        tree = cls()
+        tree.node_index = {}
+        tree.child_index = {}
+        tree.identities[0] = sys.intern(data['identity'])
+        tree.names[0] = data['name']
+        tree.statuses[0] = COMPLETED if data['status'] == Status.COMPLETED.value else WAITING
+        tree.node_index[tree.identities[0]] = 0
+        stack = [(0, data)]
+        while stack:
+            index, node_data = stack.pop()
+            for child_data in node_data['children']:
+                status = COMPLETED if child_data['status'] == Status.COMPLETED.value else WAITING
+                child = tree.append_row(child_data['name'], child_data['identity'], status)
+                tree.link(index, child)
+                stack.append((child, child_data))
+        tree.recount()
+        return tree
+
+    def get_node_by_id(self, identity: str, start_node=None) -> Optional[ColumnarNode]: # type: ignore[override]
+        index = self.node_index.get(identity)
+        if index is None:
+            return None
+        if start_node is not None:
+            # must be in the subtree of start_node
+            curr = index
+            while curr >= 0 and curr != start_node.index:
+                curr = self.parent[curr]
+            if curr < 0:
+                return None
+        return ColumnarNode(self, index)
+
+    def can_add_node(self, parent_node_id: str, new_node_name: str, new_node_id: Optional[str] = None) -> bool:
+        parent = self.node_index.get(parent_node_id)
+        if parent is None:
+            return False
+        if self.has_child_named(parent, new_node_name):
+            return False
+        return new_node_id is None or new_node_id not in self.node_index
+
+    def add_node(self, parent_node_id: str, new_node_name: str, new_node_id: Optional[str] = None) -> int:
+        if not self.can_add_node(parent_node_id, new_node_name, new_node_id):
+            return -1
+        parent = self.node_index[parent_node_id]
+        child = self.append_row(new_node_name,
+                                new_node_id if new_node_id else uuid.uuid4().hex,
+                                WAITING)
+        self.link(parent, child)
+        self.count_subtree(parent, child, 1)
+        return 0
+
+    def can_reopen_node(self, node_id: str) -> bool:
+        index = self.node_index.get(node_id)
+        return index is not None and self.statuses[index] == COMPLETED
+
+    def reopen_node(self, node_id: str) -> int:
+        if not self.can_reopen_node(node_id):
+            return -1
+        # reopen the completed ancestors as well
+        curr = self.node_index[node_id]
+        while curr >= 0 and self.statuses[curr] == COMPLETED:
+            self.set_status(curr, WAITING)
+            curr = self.parent[curr]
+        return 0
+
+    def can_complete_node(self, node_id: str) -> bool:
+        index = self.node_index.get(node_id)
+        if index is None or self.statuses[index] == COMPLETED:
+            return False
+        return self.waiting_children[index] == 0
+
+    def complete_node(self, node_id: str) -> int:
+        if not self.can_complete_node(node_id):
+            return -1
+        self.set_status(self.node_index[node_id], COMPLETED)
+        return 0
+
+    def can_remove_node(self, node_id: str) -> bool:
+        index = self.node_index.get(node_id)
+        if index is None:
+            return False
+        return self.first_child[index] == NONE and self.parent[index] >= 0
+
+    def remove_node(self, node_id: str) -> int:
+        if not self.can_remove_node(node_id):
+            return -1
+        index = self.node_index.pop(node_id)
+        self.count_subtree(self.parent[index], index, -1)
+        self.unlink(index)
+        self.parent[index] = DETACHED
+        return 0
+
+    def can_remove_subtree(self, node_id: str) -> bool:
+        index = self.node_index.get(node_id)
+        return index is not None and self.parent[index] >= 0
+
+    def remove_subtree(self, node_id: str) -> int:
+        if not self.can_remove_subtree(node_id):
+            return -1
+        index = self.node_index[node_id]
+        self.count_subtree(self.parent[index], index, -1)
+        self.unlink(index)
+        self.parent[index] = DETACHED
+        stack = [index]
+        while stack:
+            curr = stack.pop()
+            del self.node_index[self.identities[curr]]
+            for child in self.iter_children(curr):
+                self.child_index.pop((curr, self.names[child]), None)
+                stack.append(child)
+        return 0
+
+    def can_move_node(self, node_id: str, new_parent_id: str) -> bool:
+        index = self.node_index.get(node_id)
+        if index is None or self.parent[index] < 0:
+            return False
+
+        new_parent = self.node_index.get(new_parent_id)
+        if new_parent is None:
+            return False
+
+        # you can't move a node to its child
+        curr = new_parent
+        while curr >= 0:
+            if curr == index:
+                return False
+            curr = self.parent[curr]
+
+        return not self.has_child_named(new_parent, self.names[index])
+
+    def move_node(self, node_id: str, new_parent_id: str) -> int:
+        if not self.can_move_node(node_id, new_parent_id):
+            return -1
+        index = self.node_index[node_id]
+        new_parent = self.node_index[new_parent_id]
+        self.count_subtree(self.parent[index], index, -1)
+        self.unlink(index)
+        self.link(new_parent, index)
+        self.count_subtree(new_parent, index, 1)
+        return 0
+
+    def check_index(self) -> bool:
+        """
+        check if the identity index is consistent with the tree,
+        i.e. it contains exactly the nodes reachable from root
+        """
+        count = 0
+        stack = [0]
+        while stack:
+            curr = stack.pop()
+            if self.node_index.get(self.identities[curr]) != curr:
+                return False
+            count += 1
+            stack.extend(self.iter_children(curr))
+        return count == len(self.node_index)
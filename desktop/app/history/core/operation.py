@@ -37,6 +37,13 @@ OperationPayload = {
     "remove_subtree": RemoveSubtreePayload,
     "move_node": MoveNodePayload,
 }
+# building a TypeAdapter is expensive, so build one per operation type only once
+PAYLOAD_VALIDATORS = {
+    op_type: TypeAdapter(OperationPayload[op_type.value])
+    for op_type in OperationType
+}
+OPERATION_TYPES = {op_type.value: op_type for op_type in OperationType}
+
 OperationPayloadUnion = Union[AddNodePayload,
                 ReopenNodePayload,
                 CompleteNodePayload,
@@ -73,7 +80,18 @@ class Operation:
         res = method(**self.payload)
         return res
 
-def parse_operation(op_str: str) -> Optional[Operation]:
+def parse_operation(op_str: str, trusted: bool = False) -> Optional[Operation]:
+    """
+    parse an operation string, returning None if it is invalid
+    :param trusted: skip the validation, only for strings written by
+        ourselves and vouched by the hash chain (i.e. confirmed history)
+    """
+    if trusted:
+        data = json.loads(op_str)
+        return Operation(op_type=OPERATION_TYPES[data["op_type"]],
+                         payload=data["payload"],
+                         timestamp=data["timestamp"])
+
     try:
         data = json.loads(op_str)
     except json.JSONDecodeError:
@@ -83,12 +101,11 @@ def parse_operation(op_str: str) -> Optional[Operation]:
             and isinstance(data["op_type"], str) and isinstance(data["payload"], dict) and isinstance(data["timestamp"], int)):
         return None
 
-    try:
-        op_type = OperationType(data["op_type"])
-    except ValueError:
+    op_type = OPERATION_TYPES.get(data["op_type"])
+    if op_type is None:
         return None
     
-    operation_validator = TypeAdapter(OperationPayload[data["op_type"]])
+    operation_validator = PAYLOAD_VALIDATORS[op_type]
     try:
         parsed_payload = operation_validator.validate_python(data["payload"])
     except ValidationError as e:
@@ -1,6 +1,12 @@
 from enum import Enum
-import uuid
-from typing import Optional
+import uuid, sys, hashlib
+from typing import Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .operation import Operation
+
+# persist the initial id of WorkRoot
+# in order to prevent troublesome problems loading the operations
+INITIAL_ID = hashlib.sha256("WorkRoot".encode("utf-8")).hexdigest()[:32]
 
 class Status(Enum):
     """
@@ -13,25 +19,98 @@ class Status(Enum):
 
 
 class Node:
+    """
+    Every node maintains counters of its waiting children, its
+    descendants and its waiting descendants, which are updated along
+    the ancestor path whenever a status or the structure changes,
+    so that readiness and progress are answered in O(1).
+    Every node also keeps its children by name, and its own position
+    among its siblings, so that lookups by path and row() are O(1).
+    Children must be attached and detached by addChild and removeChild
+    to keep the counters and the name index right.
+    """
+    # there may be hundreds of thousands of nodes, so no __dict__ per node
+    __slots__ = ('identity', 'name', 'parent', 'children', 'child_names', 'index', '_status',
+                 'waiting_children', 'descendants', 'waiting_descendants')
+
     def __init__(self, name: str, identity: Optional[str] = None, status: Optional[str] = None, parent: Optional['Node'] = None):
-        self.identity = identity if identity else uuid.uuid4().hex
+        # identities are repeated all over the history, share one string for each
+        self.identity = sys.intern(identity if identity else uuid.uuid4().hex)
         self.name = name
         self.parent = parent
         self.children: list[Node] = []
-        self.status: Status = Status(status) if status else Status.WAITING # default status
+        self.child_names: dict[str, Node] = {}
+        self.index = 0 # position in parent.children
+        self._status: Status = Status(status) if status else Status.WAITING # default status
+        self.waiting_children = 0
+        self.descendants = 0
+        self.waiting_descendants = 0
 
-    def addChild(self, child_node):
+    @property
+    def status(self) -> Status:
+        return self._status
+
+    @status.setter
+    def status(self, status: Status):
+        if status == self._status:
+            return
+        self._status = status
+        if self.parent is None:
+            return
+        delta = 1 if status == Status.WAITING else -1
+        self.parent.waiting_children += delta
+        curr: Optional[Node] = self.parent
+        while curr is not None:
+            curr.waiting_descendants += delta
+            curr = curr.parent
+
+    def addChild(self, child_node: 'Node'):
+        child_node.index = len(self.children)
         self.children.append(child_node)
+        self.child_names[child_node.name] = child_node
+        self.count_subtree(child_node, 1)
+
+    def removeChild(self, child_node: 'Node'):
+        del self.children[child_node.index]
+        for i in range(child_node.index, len(self.children)):
+            self.children[i].index = i
+        child_node.index = 0
+        if self.child_names.get(child_node.name) is child_node:
+            del self.child_names[child_node.name]
+        self.count_subtree(child_node, -1)
+
+    def get_child(self, name: str) -> Optional['Node']:
+        return self.child_names.get(name)
+
+    def count_subtree(self, child_node: 'Node', sign: int):
+        """
+        add (sign=1) or subtract (sign=-1) the counters of a child subtree
+        on this node and its ancestors
+        """
+        child_waiting = 1 if child_node._status == Status.WAITING else 0
+        total = sign * (child_node.descendants + 1)
+        waiting = sign * (child_node.waiting_descendants + child_waiting)
+        self.waiting_children += sign * child_waiting
+        curr: Optional[Node] = self
+        while curr is not None:
+            curr.descendants += total
+            curr.waiting_descendants += waiting
+            curr = curr.parent
 
     def is_ready(self):
-        for child in self.children:
-            if child.status != Status.COMPLETED:
-                return False
-        return True
+        return self.waiting_children == 0
+
+    def progress(self) -> Optional[float]:
+        """
+        the fraction of completed descendants, None if there is no descendant
+        """
+        if self.descendants == 0:
+            return None
+        return 1 - self.waiting_descendants / self.descendants
 
     def row(self):
         if self.parent:
-            return self.parent.children.index(self)
+            return self.index
         return 0
 
     def to_dict(self):
@@ -69,15 +148,32 @@ class Tree:
     """
     def __init__(self):
         super().__init__()
-        import hashlib
-        # persist the initial id of WorkRoot
-        # in order to prevent troublesome problems loading the operations
-        INITIAL_ID = hashlib.sha256("WorkRoot".encode("utf-8")).hexdigest()[:32]
         self.root = Node("WorkRoot", identity=INITIAL_ID)
+        # identity -> node index of every node in the tree
+        # every mutation keeps it updated, so that lookups are O(1)
+        self.node_index: dict[str, Node] = {self.root.identity: self.root}
+
+    def to_dict(self):
+        """
+        return a dict of the whole tree
+        """
+        return self.root.to_dict()
+
+    @classmethod
+    def from_dict(cls, data) -> 'Tree':
+        tree = cls()
+        tree.root = Node.from_dict(data)
+        tree.node_index = {}
+        stack = [tree.root]
+        while stack:
+            curr = stack.pop()
+            tree.node_index[curr.identity] = curr
+            stack.extend(curr.children)
+        return tree
 
     def get_node_by_id(self, identity: str, start_node=None) -> Optional[Node]:
         if start_node is None:
-            start_node = self.root
+            return self.node_index.get(identity)
 
         if start_node.identity == identity:
             return start_node
@@ -88,83 +184,141 @@ class Tree:
                 return found
         return None
 
-    def add_node(self, parent_node_id: str, new_node_name: str, new_node_id: Optional[str] = None) -> int:
-        parent_node = self.get_node_by_id(parent_node_id)
+    def validate(self, operation: 'Operation') -> bool:
+        """
+        dry-run an operation: whether it would be applied successfully,
+        without modifying the tree
+        """
+        method = getattr(self, "can_" + operation.op_type.value, None)
+        if method is None:
+            return False
+        try:
+            return method(**operation.payload)
+        except TypeError:
+            # the payload doesn't fit the operation type
+            return False
+
+    # every can_* method checks the preconditions of the operation with
+    # the same name, and the operation calls it before changing anything,
+    # so that validation and application never disagree
+
+    def can_add_node(self, parent_node_id: str, new_node_name: str, new_node_id: Optional[str] = None) -> bool:
+        parent_node = self.node_index.get(parent_node_id)
         if parent_node is None:
+            return False
+        if parent_node.get_child(new_node_name) is not None:
+            return False
+        if new_node_id is not None and new_node_id in self.node_index:
+            return False
+        return True
+
+    def add_node(self, parent_node_id: str, new_node_name: str, new_node_id: Optional[str] = None) -> int:
+        if not self.can_add_node(parent_node_id, new_node_name, new_node_id):
             return -1
-        if new_node_name in [child.name for child in parent_node.children]:
-            return -1
+        parent_node = self.node_index[parent_node_id]
         new_node = Node(new_node_name, 
                         identity=new_node_id,
                         parent=parent_node)
         parent_node.addChild(new_node)
+        self.node_index[new_node.identity] = new_node
         return 0
 
+    def can_reopen_node(self, node_id: str) -> bool:
+        node = self.node_index.get(node_id)
+        return node is not None and node.status == Status.COMPLETED
+
     def reopen_node(self, node_id: str) -> int:
-        node = self.get_node_by_id(node_id)
-        if node is None or node.status != Status.COMPLETED:
+        if not self.can_reopen_node(node_id):
             return -1
-        def reopen(curr: Node):
-            if curr.parent is not None and curr.parent.status == Status.COMPLETED:
-                res = reopen(curr.parent)
-                if res == -1:
-                    return -1
+        # reopen the completed ancestors as well
+        curr: Optional[Node] = self.node_index[node_id]
+        while curr is not None and curr.status == Status.COMPLETED:
             curr.status = Status.WAITING
-            return 0
-
-        if reopen(node) == -1:
-            return -1
-
+            curr = curr.parent
         return 0
 
-    def complete_node(self, node_id: str) -> int:
-        node = self.get_node_by_id(node_id)
+    def can_complete_node(self, node_id: str) -> bool:
+        node = self.node_index.get(node_id)
         if node is None or not node.is_ready():
+            return False
+        return node.status != Status.COMPLETED
+
+    def complete_node(self, node_id: str) -> int:
+        if not self.can_complete_node(node_id):
             return -1
-        if node.status == Status.COMPLETED:
-            return -1
-        node.status = Status.COMPLETED
+        self.node_index[node_id].status = Status.COMPLETED
         return 0
+
+    def can_remove_node(self, node_id: str) -> bool:
+        node = self.node_index.get(node_id)
+        if node is None:
+            return False
+        return not node.children and node.parent is not None
     
     def remove_node(self, node_id: str) -> int:
-        node = self.get_node_by_id(node_id)
-        if node is None:
-            return -1
-        if node.children or (node.parent is None):
+        if not self.can_remove_node(node_id):
             return -1
-        node.parent.children.remove(node)
+        node = self.node_index.pop(node_id)
+        node.parent.removeChild(node) # type: ignore
         return 0
+
+    def can_remove_subtree(self, node_id: str) -> bool:
+        node = self.node_index.get(node_id)
+        return node is not None and node.parent is not None
     
     def remove_subtree(self, node_id: str) -> int:
-        node = self.get_node_by_id(node_id)
-        if node is None:
+        if not self.can_remove_subtree(node_id):
             return -1
-        if node.parent is None:
-            return -1
-
-        node.parent.children.remove(node)
+        node = self.node_index[node_id]
+        node.parent.removeChild(node) # type: ignore
+        stack = [node]
+        while stack:
+            curr = stack.pop()
+            del self.node_index[curr.identity]
+            stack.extend(curr.children)
         return 0
-    
-    def move_node(self, node_id: str, new_parent_id: str) -> int:
-        node = self.get_node_by_id(node_id)
+
+    def can_move_node(self, node_id: str, new_parent_id: str) -> bool:
+        node = self.node_index.get(node_id)
         if node is None or node.parent is None:
-            return -1
+            return False
 
-        new_parent = self.get_node_by_id(new_parent_id)
+        new_parent = self.node_index.get(new_parent_id)
         if new_parent is None:
-            return -1
+            return False
 
-        # you can't move a node to its child
+        # you can't move a node to its child,
+        # which takes a walk over the ancestors of new_parent, O(depth)
         curr: Optional[Node] = new_parent
-        while curr is not None and curr.identity != self.root.identity:
-            if curr == node:
-                return -1
+        while curr is not None:
+            if curr is node:
+                return False
             curr = curr.parent
         
-        if any([child.name == node.name for child in new_parent.children]):
+        return new_parent.get_child(node.name) is None
+    
+    def move_node(self, node_id: str, new_parent_id: str) -> int:
+        if not self.can_move_node(node_id, new_parent_id):
             return -1
-
-        node.parent.children.remove(node)
+        node = self.node_index[node_id]
+        new_parent = self.node_index[new_parent_id]
+        node.parent.removeChild(node) # type: ignore
+        node.parent = None
         new_parent.addChild(node)
         node.parent = new_parent
-        return 0
\ No newline at end of file
+        return 0
+
+    def check_index(self) -> bool:
+        """
+        check if the identity index is consistent with the tree,
+        i.e. it contains exactly the nodes reachable from root
+        """
+        count = 0
+        stack = [self.root]
+        while stack:
+            curr = stack.pop()
+            if self.node_index.get(curr.identity) is not curr:
+                return False
+            count += 1
+            stack.extend(curr.children)
+        return count == len(self.node_index)
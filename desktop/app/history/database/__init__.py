@@ -5,27 +5,44 @@
 
 from __future__ import annotations
 from pathlib import Path
-from PyQt5.QtCore import QObject, pyqtSignal
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from PyQt5.QtCore import QObject, pyqtSignal, QTimer
+from contextlib import contextmanager
+from sqlalchemy.orm import sessionmaker, scoped_session
 from app.user import UserManager
+from app.globals import context
 from .models import Base
+from .migrations import migrate
+from .storage import create_storage_engine, synced_commit, FAST
 from .confirmed_history import ConfirmedHistory
 from .pending_queue import PendingQueue
+from .snapshot_store import SnapshotStore
+from .bulk_reader import BulkReader
+from .read_view import open_read_view
+from .collector import Collector, GC_BATCH
+from sqlalchemy.exc import OperationalError
 import logging
 
 
 class Database(QObject):
     updated = pyqtSignal()
     """
-    Database possesses pending queue and confirmed history,
-    and meanwhile provides a SQL session for them.
+    Database possesses pending queue, confirmed history and the
+    snapshots of confirmed history, and meanwhile provides a SQL session for them.
     Pending queue and confirmed history do not care which SQL 
     connection they are interacting with, and they only use the session
     provided by Database.
     Database changes the SQLite file when the user is changed,
     and afterwards recreates pending queue and confirmed history,
     to let them interacts with the new SQL connection.
+    Changes of pending queue and confirmed history are not notified
+    one by one: a burst of them within `history/updateInterval` ms
+    emits `updated` only once, and a transaction groups several
+    changes into one commit.
+    The SQLite file is set up by the storage profile (see storage.py).
+    Only the main thread writes, and the others read through read
+    views on sessions of their own.
+    Dead rows are collected in the background every
+    `history/gcInterval` ms, see collector.py.
     """
     def __init__(self,
                  user_manager: UserManager,
@@ -45,6 +62,22 @@ class Database(QObject):
 
         self.logger = logging.getLogger(__name__)
 
+        # changes are notified at most once in an interval, see notify()
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.emit_updated)
+        # commits of pending queue are grouped under the fast storage profile
+        self.commit_timer = QTimer(self)
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.timeout.connect(self.flush)
+        # set while committed changes of pending queue wait for the timer
+        self.grouped = False
+        self.gc_timer = QTimer(self)
+        self.gc_timer.timeout.connect(self.collect_garbage)
+        self.transaction_depth = 0
+        self.changed_in_transaction = False
+        self.synced_in_transaction = False
+
         db_dir: Path = self.storage_root_path / self.user_manager.user_id()
         db_dir.mkdir(exist_ok=True)
         db_path: Path = self.storage_root_path / self.user_manager.user_id() / self.filename
@@ -52,16 +85,31 @@ class Database(QObject):
         db_url = f"sqlite:///" + str(db_path)
         self.logger.debug(f"Loading database at {db_url}")
         
-        self.engine = create_engine(db_url)
+        self.profile = context.settings_manager.get("history/storageProfile", type=str)
+        self.engine = create_storage_engine(db_url, self.profile)
         Base.metadata.create_all(self.engine)
+        migrate(self.engine)
         self.session = sessionmaker(bind=self.engine)()
+        # sessions of the other threads, one per thread
+        self.thread_sessions = scoped_session(sessionmaker(bind=self.engine))
 
-        self.pending_queue = PendingQueue(self.session)
-        self.confirmed_history = ConfirmedHistory(self.session)
-        self.pending_queue.updated.connect(self.updated.emit)
-        self.confirmed_history.updated.connect(self.updated.emit)
+        compact = context.settings_manager.get("history/compactEncoding", type=bool)
+        self.pending_queue = PendingQueue(self.session, compact)
+        self.confirmed_history = ConfirmedHistory(self.session, compact)
+        self.snapshot_store = SnapshotStore(self.session)
+        self.bulk_reader = BulkReader(self.session)
+        self.collector = Collector(self.session, self.engine, self.pending_queue, self.confirmed_history)
+        self.pending_queue.committer = self.commit_pending
+        self.confirmed_history.committer = self.commit_confirmed
+        self.pending_queue.updated.connect(self.notify)
+        self.confirmed_history.updated.connect(self.notify)
+        gc_interval = context.settings_manager.get("history/gcInterval", type=int)
+        if gc_interval > 0:
+            self.gc_timer.start(gc_interval)
 
     def reload_database(self):
+        self.flush()
+        self.thread_sessions.remove()
         self.engine.dispose()
         
         db_dir: Path = self.storage_root_path / self.user_manager.user_id()
@@ -70,15 +118,151 @@ class Database(QObject):
         db_path.touch(exist_ok=True)
         db_url = f"sqlite:///" + str(db_path)
         self.logger.debug(f"Reloading database at {db_url}")
-        self.engine = create_engine(db_url)
+        self.profile = context.settings_manager.get("history/storageProfile", type=str)
+        self.engine = create_storage_engine(db_url, self.profile)
         Base.metadata.create_all(self.engine)
+        migrate(self.engine)
         self.session = sessionmaker(bind=self.engine)()
-        self.pending_queue = PendingQueue(self.session)
-        self.confirmed_history = ConfirmedHistory(self.session)
-        self.pending_queue.updated.connect(self.updated.emit)
-        self.confirmed_history.updated.connect(self.updated.emit)
+        # sessions of the other threads, one per thread
+        self.thread_sessions = scoped_session(sessionmaker(bind=self.engine))
+        compact = context.settings_manager.get("history/compactEncoding", type=bool)
+        self.pending_queue = PendingQueue(self.session, compact)
+        self.confirmed_history = ConfirmedHistory(self.session, compact)
+        self.snapshot_store = SnapshotStore(self.session)
+        self.bulk_reader = BulkReader(self.session)
+        self.collector = Collector(self.session, self.engine, self.pending_queue, self.confirmed_history)
+        self.pending_queue.committer = self.commit_pending
+        self.confirmed_history.committer = self.commit_confirmed
+        self.pending_queue.updated.connect(self.notify)
+        self.confirmed_history.updated.connect(self.notify)
+        self.updated.emit()
+
+    def notify(self):
+        """
+        schedule an `updated` emission for a change
+        """
+        if self.transaction_depth > 0:
+            self.changed_in_transaction = True
+            return
+        interval = context.settings_manager.get("history/updateInterval", type=int)
+        if interval <= 0:
+            self.emit_updated()
+            return
+        # not restarted by later changes, so that a steady stream of
+        # changes is still notified every interval
+        if not self.update_timer.isActive():
+            self.update_timer.start(interval)
+
+    def notify_now(self):
+        """
+        emit a scheduled `updated` emission right away
+        """
+        if self.update_timer.isActive():
+            self.update_timer.stop()
+            self.emit_updated()
+
+    def emit_updated(self):
+        # whoever reads on another connection must see the changes
+        self.flush()
         self.updated.emit()
 
+    def commit_pending(self):
+        """
+        committer of pending queue
+        Under the fast storage profile, the commits within
+        `history/groupCommitWindow` ms are grouped into one.
+        """
+        if self.transaction_depth > 0:
+            return
+        window = context.settings_manager.get("history/groupCommitWindow", type=int)
+        if self.profile != FAST or window <= 0:
+            self.session.commit()
+            return
+        self.grouped = True
+        if not self.commit_timer.isActive():
+            self.commit_timer.start(window)
+
+    def commit_confirmed(self):
+        """
+        committer of confirmed history, whose commits are always synced
+        """
+        if self.transaction_depth > 0:
+            self.synced_in_transaction = True
+            return
+        # it commits the grouped changes as well
+        self.commit_timer.stop()
+        self.grouped = False
+        synced_commit(self.session, self.profile)
+
+    def flush(self):
+        """
+        commit the grouped changes now
+        """
+        # not isActive(), which is already false when the timer fires
+        if not self.grouped:
+            return
+        self.commit_timer.stop()
+        self.grouped = False
+        self.session.commit()
+
+    def collect_garbage(self):
+        """
+        a background step of the collector, run between transactions
+        """
+        if self.transaction_depth > 0:
+            return
+        self.flush()
+        try:
+            self.collector.collect(GC_BATCH)
+            self.collector.incremental_vacuum()
+        except OperationalError as e:
+            # e.g. locked by a read view, try again next time
+            self.session.rollback()
+            self.logger.warning(f"Garbage collection step failed: {e}")
+
+    @contextmanager
+    def read_view(self):
+        """
+        open a read view on a session of the current thread
+        the main thread should use the components instead
+        """
+        with open_read_view(self.thread_sessions()) as view:
+            yield view
+
+    @contextmanager
+    def transaction(self):
+        """
+        group the changes to pending queue and confirmed history made
+        in the block into one commit and one `updated` emission
+        the changes are rolled back if the block raises
+        transactions can be nested, only the outermost one commits
+        """
+        if self.transaction_depth == 0:
+            # keep the grouped changes out of a rollback
+            self.flush()
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if self.transaction_depth == 1:
+                self.session.rollback()
+                self.changed_in_transaction = False
+                self.synced_in_transaction = False
+            raise
+        else:
+            if self.transaction_depth == 1:
+                if self.synced_in_transaction:
+                    self.synced_in_transaction = False
+                    synced_commit(self.session, self.profile)
+                else:
+                    self.session.commit()
+        finally:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                if self.changed_in_transaction:
+                    self.changed_in_transaction = False
+                    self.notify()
+
 if __name__ == '__main__':
     class UM:
         def user_id(self):
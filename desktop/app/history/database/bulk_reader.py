@@ -0,0 +1,81 @@
+from __future__ import annotations
+from typing import Iterator, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.history.core import Operation, decode_operation, StoredOperation
+from .models import ConfirmedHistoryMetadata, ConfirmedOperationNode,\
+                    PendingQueueMetadata, PendingOperationNode, HistoryBaseline
+
+YIELD_PER = 1000 # rows fetched from the cursor at a time
+
+
+class BulkReader:
+    """
+    Bulk reader streams the operations of the history for replaying.
+    It runs one query for the confirmed history and one for the pending
+    queue, reading plain row tuples instead of ORM objects, and parses
+    the operations lazily while the caller iterates.
+    It never writes, so that the replay thread can use it on a session
+    of its own.
+    """
+    def __init__(self, session: Session):
+        self.session = session
+
+    def confirmed(self, start: int, end: int) -> Iterator[tuple[int, StoredOperation, Operation]]:
+        """
+        yield (serial_num, stored operation, operation) of the confirmed
+        operations with serial num from start to end (both inclusive)
+        """
+        query = select(ConfirmedOperationNode.serial_num, ConfirmedOperationNode.operation).\
+                where(ConfirmedOperationNode.serial_num.between(start, end)).\
+                order_by(ConfirmedOperationNode.serial_num.asc())
+        result = self.session.execute(query, execution_options={"yield_per": YIELD_PER})
+        try:
+            for serial_num, data in result:
+                # vouched by the hash chain, no need to validate
+                operation = decode_operation(data, trusted=True)
+                assert operation is not None
+                yield serial_num, data, operation
+        finally:
+            result.close()
+
+    def pending(self, head_id: int, tail_id: int) -> Iterator[tuple[int, StoredOperation, Operation]]:
+        """
+        yield (node id, stored operation, operation) of the pending
+        operations in the queue, from head_id (inclusive) to tail_id (exclusive)
+        """
+        query = select(PendingOperationNode.id, PendingOperationNode.operation).\
+                where(PendingOperationNode.id >= head_id, PendingOperationNode.id < tail_id).\
+                order_by(PendingOperationNode.id.asc())
+        result = self.session.execute(query, execution_options={"yield_per": YIELD_PER})
+        try:
+            for node_id, data in result:
+                operation = decode_operation(data)
+                assert operation is not None
+                yield node_id, data, operation
+        finally:
+            result.close()
+
+    def confirmed_head(self) -> Optional[tuple[int, str]]:
+        """
+        (serial_num, history_hash) of the head of confirmed history
+        """
+        query = select(ConfirmedOperationNode.serial_num, ConfirmedOperationNode.history_hash).\
+                join(ConfirmedHistoryMetadata, ConfirmedHistoryMetadata.head_id == ConfirmedOperationNode.id)
+        row = self.session.execute(query).first()
+        return None if row is None else (row[0], row[1])
+
+    def hashcodes_at(self, serial_nums: list[int]) -> dict[int, str]:
+        query = select(ConfirmedOperationNode.serial_num, ConfirmedOperationNode.history_hash).\
+                where(ConfirmedOperationNode.serial_num.in_(serial_nums))
+        return {serial_num: history_hash for serial_num, history_hash in self.session.execute(query)}
+
+    def pending_range(self) -> tuple[int, int]:
+        """
+        (head_id, tail_id) of the pending queue
+        """
+        row = self.session.execute(select(PendingQueueMetadata.head_id, PendingQueueMetadata.tail_id)).first()
+        return (1, 1) if row is None else (row[0], row[1])
+
+    def baseline(self) -> Optional[HistoryBaseline]:
+        return self.session.scalars(select(HistoryBaseline)).first()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+from typing import NamedTuple, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import Engine, select, delete, func
+from .models import PendingOperationNode, ConfirmedOperationNode
+from .pending_queue import PendingQueue
+from .confirmed_history import ConfirmedHistory
+import logging
+
+GC_BATCH = 500 # dead rows removed by a background step
+VACUUM_PAGES = 64 # free pages given back by a background step
+
+
+class CollectResult(NamedTuple):
+    pending: int # pending operations removed
+    confirmed: int # confirmed operations removed
+
+
+class Collector:
+    """
+    Collector removes the rows unreachable from the heads: pending
+    operations popped from the head (before head_id) or from the tail
+    (from tail_id on), and confirmed operations beyond the head.
+    Once the queue is empty and the popped ones are all removed, the ids
+    start from 1 again, so that they don't grow forever. Only an empty
+    queue is renumbered, so that no id held by others moves.
+    Database runs bounded steps of it in the background, and gives the
+    free pages back with incremental vacuum, while the `gc` command
+    runs it to the end and vacuums the whole file.
+    """
+    def __init__(self,
+                 session: Session,
+                 engine: Engine,
+                 pending_queue: PendingQueue,
+                 confirmed_history: ConfirmedHistory):
+        self.session = session
+        self.engine = engine
+        self.pending_queue = pending_queue
+        self.confirmed_history = confirmed_history
+        self.logger = logging.getLogger(__name__)
+
+    def collect(self, limit: Optional[int] = None) -> CollectResult:
+        """
+        remove up to `limit` dead rows (all if None), and commit
+        """
+        metadata = self.pending_queue.metadata
+        assert metadata is not None
+        popped = (PendingOperationNode.id < metadata.head_id) | (PendingOperationNode.id >= metadata.tail_id)
+        pending = self.remove(PendingOperationNode, PendingOperationNode.id, popped, limit)
+
+        head = self.confirmed_history.get_head()
+        length = 0 if head is None else head.serial_num
+        confirmed = 0
+        if limit is None or pending < limit:
+            beyond = ConfirmedOperationNode.serial_num > length
+            confirmed = self.remove(ConfirmedOperationNode, ConfirmedOperationNode.id, beyond,
+                                    None if limit is None else limit - pending)
+            if confirmed:
+                self.confirmed_history.index.truncate(length)
+
+        # only an empty queue, whose ids nobody holds
+        renumbered = metadata.head_id > 1 and metadata.head_id == metadata.tail_id and \
+                self.session.scalar(select(func.count()).select_from(PendingOperationNode).where(popped)) == 0
+        if renumbered:
+            metadata.head_id = metadata.tail_id = 1
+        self.session.commit()
+        if pending or confirmed:
+            self.logger.info(f"Collected {pending} pending and {confirmed} confirmed operations")
+        if renumbered:
+            self.pending_queue.updated.emit()
+        return CollectResult(pending, confirmed)
+
+    def remove(self, model, key, condition, limit: Optional[int]) -> int:
+        query = select(key).where(condition)
+        if limit is not None:
+            query = query.limit(limit)
+        result = self.session.execute(delete(model).where(key.in_(query)),
+                                      execution_options={"synchronize_session": False})
+        return result.rowcount # type: ignore[attr-defined]
+
+    def incremental_vacuum(self, pages: int = VACUUM_PAGES):
+        """
+        give up to `pages` free pages back to the file system
+        a no-op unless the file is in incremental auto vacuum mode
+        """
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql(f"PRAGMA incremental_vacuum({pages})")
+            connection.commit()
+
+    def vacuum(self) -> int:
+        """
+        rebuild the whole file, which also turns on incremental auto vacuum
+        for the files created before it, and return the bytes reclaimed
+        """
+        # VACUUM can't run in a transaction
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            page_size = connection.exec_driver_sql("PRAGMA page_size").scalar() or 0
+            before = connection.exec_driver_sql("PRAGMA page_count").scalar() or 0
+            connection.exec_driver_sql("VACUUM")
+            after = connection.exec_driver_sql("PRAGMA page_count").scalar() or 0
+            if connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal":
+                connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return page_size * (before - after)
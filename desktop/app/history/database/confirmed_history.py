@@ -1,10 +1,13 @@
 from __future__ import annotations
 from PyQt5.QtCore import pyqtSignal, QObject
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from app.history.core import Operation
-from .models import ConfirmedHistoryMetadata, ConfirmedOperationNode
-import hashlib, logging
+from typing import Callable, Optional
+from sqlalchemy import select, insert, update, delete, func
+from app.history.core import Operation, Tree, encode_operation, canonical_form
+from .models import ConfirmedHistoryMetadata, ConfirmedOperationNode, HistoryBaseline
+from .merkle_index import MerkleIndex, leaf_hash
+from .snapshot_store import dump_tree
+import hashlib, json, logging
 
 
 class ConfirmedHistory(QObject):
@@ -16,10 +19,23 @@ class ConfirmedHistory(QObject):
     Confirmed history must be integral and non-conflicting.
     Many parts are designed to try to synchronize the confirmed history
     with server in time.
+    Operations are stored in compact binary form if `compact` is set,
+    while the history hashes are always calculated from the canonical
+    JSON form, so they don't depend on the storage form.
+    Every change is committed through the committer, with which
+    Database groups commits or defers them to a transaction.
+    The merkle index over the operations is kept along with every
+    change, see merkle_index.py.
+    The operations before a serial num can be squashed into a baseline,
+    the tree built from the operations up to it, and then the confirmed
+    history starts from that serial num.
     """
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, compact: bool = False):
         super().__init__()
         self.session = session
+        self.compact = compact
+        # Database replaces it to group or sync the commits
+        self.committer: Callable[[], None] = self.session.commit
         self.metadata = self.session.query(ConfirmedHistoryMetadata).first()
         if self.metadata is None:
             self.metadata = ConfirmedHistoryMetadata(head_id=0)
@@ -27,7 +43,42 @@ class ConfirmedHistory(QObject):
             self.session.commit()
 
         self.logger = logging.getLogger(__name__)
+        self.index = MerkleIndex(self.session)
+        self.catch_up_index()
     
+    def commit(self):
+        self.committer()
+
+    def catch_up_index(self):
+        """
+        index the operations confirmed before the index existed
+        """
+        head = self.get_head()
+        length = 0 if head is None else head.serial_num
+        size = self.index.size()
+        if size == length:
+            return
+        self.logger.info(f"Indexing confirmed operations from serial {min(size, length)+1}")
+        baseline = self.get_baseline()
+        if baseline is not None and size < baseline.serial_num-1:
+            # the squashed operations are gone, but their blocks are kept
+            self.index.truncate(0)
+            self.index.restore(baseline.serial_num-1, json.loads(baseline.index_blocks))
+            size = baseline.serial_num-1
+        if size > length:
+            self.index.truncate(length)
+        else:
+            chunk: list[str] = []
+            position = size
+            for node in self.iter_range(size+1, length):
+                chunk.append(leaf_hash(canonical_form(node.operation)))
+                if len(chunk) == 1000:
+                    self.index.append(position, chunk)
+                    position += len(chunk)
+                    chunk = []
+            self.index.append(position, chunk)
+        self.session.commit()
+
     def get_by_id(self, node_id: int):
         query = select(ConfirmedOperationNode).\
                 where(ConfirmedOperationNode.id==node_id)
@@ -35,13 +86,24 @@ class ConfirmedHistory(QObject):
         return node
     
     def get_by_serial_num(self, serial_num: int):
-        head = self.get_head()
-        while head is not None:
-            if head.serial_num == serial_num:
-                return head
-            head = self.get_by_id(head.next_id)
-        
-        return None
+        query = select(ConfirmedOperationNode).\
+                where(ConfirmedOperationNode.serial_num==serial_num)
+        node = self.session.scalars(query).first()
+        return node
+
+    def iter_range(self, start: int, end: int):
+        """
+        Stream the nodes with serial num from start to end (both inclusive)
+        in serial order, using a single query.
+        """
+        query = select(ConfirmedOperationNode).\
+                where(ConfirmedOperationNode.serial_num.between(start, end)).\
+                order_by(ConfirmedOperationNode.serial_num.asc())
+        result = self.session.scalars(query, execution_options={"yield_per": 500})
+        try:
+            yield from result
+        finally:
+            result.close()
 
     def get_head(self):
         assert self.metadata is not None
@@ -59,7 +121,7 @@ class ConfirmedHistory(QObject):
         
         hashcode = calculate_hash("" if prev is None else prev.history_hash, operation)
         node = ConfirmedOperationNode(serial_num=serial_num,
-                                      operation=operation.stringify(),
+                                      operation=encode_operation(operation, self.compact),
                                       history_hash=hashcode,)
         if prev is None:
             node.next_id = 0
@@ -67,35 +129,116 @@ class ConfirmedHistory(QObject):
             node.next_node = prev
         self.session.add(node)
         self.metadata.head_node = node
-        self.session.commit()
+        self.index.append(serial_num-1, [leaf_hash(operation.stringify())])
+        self.commit()
         self.updated.emit()
         return node
     
+    def append_many(self, operations: list[Operation], starting_serial_num: int):
+        """
+        insert a run of operations with consecutive serial nums at the head,
+        in one commit and with one `updated` signal
+        """
+        assert self.metadata is not None
+        if not operations:
+            return
+        prev = self.get_head()
+        expected_serial = 1 if prev is None else prev.serial_num+1
+        if expected_serial != starting_serial_num:
+            raise ValueError("Unexpected serial num(marking a damage of data)")
+
+        self.write_run(prev, starting_serial_num, operations)
+        self.commit()
+        self.updated.emit()
+
     def overwrite(self, starting_serial_num: int, operations: list[Operation]):
+        """
+        replace the operations from starting_serial_num on, in one commit
+        Overwriting from serial 1 drops the baseline, while the squashed
+        operations can't be overwritten otherwise.
+        """
         self.logger.debug("Overwriting confirmed history.")
         assert self.metadata is not None
-        nodes: list[ConfirmedOperationNode] = []
+        baseline = self.get_baseline()
+        if baseline is not None and starting_serial_num <= baseline.serial_num:
+            if starting_serial_num > 1:
+                raise ValueError(f"Operations up to serial {baseline.serial_num} are squashed")
+            self.session.delete(baseline)
         prev = self.get_by_serial_num(starting_serial_num-1)
-        for i in range(len(operations)):
-            hashcode = calculate_hash("" if prev is None else prev.history_hash, operations[i])
-            node = ConfirmedOperationNode(serial_num=starting_serial_num+i,
-                                          operation=operations[i].stringify(),
-                                          history_hash=hashcode,)
-            if prev is not None:
-                node.next_node = prev
-            else:
-                node.next_id = 0
-            nodes.append(node)
-            prev = node
-
-        self.session.add_all(nodes)
-        if prev is None:
-            self.metadata.head_id = 0
-        else:
-            self.metadata.head_node = prev
-        self.session.commit()
+        # remove the superseded operations, since serial num is unique
+        self.session.execute(delete(ConfirmedOperationNode).\
+                             where(ConfirmedOperationNode.serial_num >= starting_serial_num))
+        self.index.truncate(starting_serial_num-1)
+        self.write_run(prev, starting_serial_num, operations)
+        self.commit()
         self.updated.emit()
-        return nodes
+
+    def get_baseline(self):
+        query = select(HistoryBaseline)
+        return self.session.scalars(query).first()
+
+    def squash(self, serial_num: int, tree: Tree):
+        """
+        replace the operations before serial_num by a baseline
+        :param tree: the tree built from the confirmed operations up to serial_num
+        The operation at serial_num is kept as the first one, since it
+        carries the history hash the later ones are chained on.
+        """
+        node = self.get_by_serial_num(serial_num)
+        if node is None:
+            raise ValueError(f"No confirmed operation at serial {serial_num}")
+        baseline = self.get_baseline()
+        if baseline is not None and baseline.serial_num >= serial_num:
+            raise ValueError(f"Operations up to serial {baseline.serial_num} are squashed already")
+
+        self.logger.info(f"Squashing confirmed operations before serial {serial_num}")
+        index_blocks = self.index.squash(serial_num-1)
+        self.session.execute(delete(ConfirmedOperationNode).\
+                             where(ConfirmedOperationNode.serial_num < serial_num))
+        self.session.execute(update(ConfirmedOperationNode).\
+                             where(ConfirmedOperationNode.id == node.id).\
+                             values(next_id=0))
+        if baseline is None:
+            baseline = HistoryBaseline()
+            self.session.add(baseline)
+        baseline.serial_num = serial_num
+        baseline.history_hash = node.history_hash
+        baseline.tree = dump_tree(tree)
+        baseline.index_blocks = json.dumps(index_blocks)
+        self.commit()
+
+    def write_run(self, prev: Optional[ConfirmedOperationNode], starting_serial_num: int,
+                  operations: list[Operation]):
+        """
+        write a run of operations after prev, the last of which becomes the head
+        The hash chain is calculated in a plain loop, and the rows are
+        linked by explicit ids and inserted by one executemany, instead
+        of flushing ORM objects linked by relationships, whose ordering
+        costs quadratic time on a long run.
+        """
+        assert self.metadata is not None
+        node_id = self.session.scalar(select(func.max(ConfirmedOperationNode.id))) or 0
+        prev_id = 0 if prev is None else prev.id
+        prev_hash = "" if prev is None else prev.history_hash
+        rows = []
+        leaves = []
+        for i, operation in enumerate(operations):
+            form = operation.stringify()
+            prev_hash = hashlib.sha256((prev_hash + form).encode('utf-8')).hexdigest()
+            node_id += 1
+            rows.append({
+                "id": node_id,
+                "serial_num": starting_serial_num+i,
+                "operation": encode_operation(operation, self.compact),
+                "history_hash": prev_hash,
+                "next_id": prev_id,
+            })
+            leaves.append(leaf_hash(form))
+            prev_id = node_id
+        if rows:
+            self.session.execute(insert(ConfirmedOperationNode), rows)
+        self.metadata.head_id = prev_id
+        self.index.append(starting_serial_num-1, leaves)
 
 
 def calculate_hash(prev_hash: str, operation: Operation):
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, delete, func, literal, tuple_
+from typing import Iterable, Optional
+from .models import MerkleNode
+import hashlib, logging
+
+
+class MerkleIndex:
+    """
+    Merkle index is a segment tree of hashes over the confirmed
+    operations, which summarizes any range of them in a few hashes.
+    The node at (level, position) covers the operations at positions
+    position*2^level to (position+1)*2^level-1 (the position of an
+    operation is its serial num - 1), and is stored only once all of
+    them exist: a leaf hashes the canonical form of its operation, and
+    a parent hashes the hashes of its two children.
+    So appending an operation adds its leaf and the parents of the
+    blocks it completes, and overwriting from a serial num only drops
+    the nodes covering it or later ones.
+    Squashing a prefix keeps only its maximal aligned blocks, which
+    are all that ranges from serial 1 and later appends need.
+    A range splits into O(log N) aligned blocks, whose hashes are
+    folded into the hash of the range, so two histories agree on a
+    range iff the hashes of the range agree.
+    Confirmed history maintains it, and commits it with its own changes.
+    """
+    def __init__(self, session: Session):
+        self.session = session
+        self.logger = logging.getLogger(__name__)
+
+    def size(self) -> int:
+        """
+        the number of operations indexed
+        """
+        # the end of the last block, as a squashed prefix has no leaves
+        query = select(func.max((MerkleNode.position + 1).op("<<")(MerkleNode.level)))
+        return self.session.scalar(query) or 0
+
+    def get(self, level: int, position: int) -> Optional[str]:
+        query = select(MerkleNode.hash).\
+                where(MerkleNode.level == level, MerkleNode.position == position)
+        return self.session.scalar(query)
+
+    def append(self, position: int, leaves: Iterable[str]):
+        """
+        index the operations from `position` on, given their leaf hashes
+        the operations before `position` must be indexed already
+        """
+        hashes = list(leaves)
+        level = 0
+        rows = []
+        while hashes:
+            rows.extend({"level": level, "position": position+i, "hash": h} for i, h in enumerate(hashes))
+            if position % 2 == 1:
+                # the first one completes the block of its left sibling
+                left = self.get(level, position-1)
+                assert left is not None, "broken merkle index"
+                hashes = [left] + hashes
+                position -= 1
+            hashes = [hash_pair(hashes[i], hashes[i+1]) for i in range(0, len(hashes)-1, 2)]
+            position //= 2
+            level += 1
+        if rows:
+            self.session.execute(insert(MerkleNode), rows)
+
+    def truncate(self, position: int):
+        """
+        drop the operations from `position` on, and every block covering them
+        """
+        self.session.execute(delete(MerkleNode).\
+                             where(MerkleNode.position >= literal(position).op(">>")(MerkleNode.level)))
+
+    def squash(self, position: int) -> list[str]:
+        """
+        drop the nodes inside the operations before `position`, except
+        the maximal aligned blocks of them, and return their hashes
+        """
+        blocks = split_range(0, position)
+        hashes = self.block_hashes(blocks)
+        if len(hashes) != len(blocks):
+            raise ValueError(f"Serial nums 1 to {position} are not indexed")
+        self.session.execute(delete(MerkleNode).\
+                             where((MerkleNode.position + 1).op("<<")(MerkleNode.level) <= position,
+                                   tuple_(MerkleNode.level, MerkleNode.position).not_in(blocks)))
+        return [hashes[block] for block in blocks]
+
+    def restore(self, position: int, hashes: list[str]):
+        """
+        put back the blocks of the operations before `position`, as returned by squash
+        """
+        rows = [{"level": level, "position": p, "hash": h}
+                for (level, p), h in zip(split_range(0, position), hashes)]
+        if rows:
+            self.session.execute(insert(MerkleNode), rows)
+
+    def range_hash(self, start: int, end: int) -> str:
+        """
+        the hash of the operations with serial num from start to end (both inclusive)
+        """
+        blocks = split_range(start-1, end)
+        hashes = self.block_hashes(blocks)
+        if len(hashes) != len(blocks):
+            raise ValueError(f"Serial nums {start} to {end} are not indexed")
+        return fold([hashes[block] for block in blocks])
+
+    def root(self) -> str:
+        """
+        the hash of all operations indexed ("" if none)
+        """
+        size = self.size()
+        return "" if size == 0 else self.range_hash(1, size)
+
+    def block_hashes(self, blocks: list[tuple[int, int]]) -> dict[tuple[int, int], str]:
+        query = select(MerkleNode.level, MerkleNode.position, MerkleNode.hash).\
+                where(tuple_(MerkleNode.level, MerkleNode.position).in_(blocks))
+        return {(level, position): h for level, position, h in self.session.execute(query)}
+
+
+def leaf_hash(form: str) -> str:
+    """
+    the hash of an operation in canonical form
+    """
+    return hashlib.sha256(form.encode('utf-8')).hexdigest()
+
+
+def hash_pair(left: str, right: str) -> str:
+    return hashlib.sha256((left + right).encode('utf-8')).hexdigest()
+
+
+def fold(hashes: list[str]) -> str:
+    result = hashes[0]
+    for h in hashes[1:]:
+        result = hash_pair(result, h)
+    return result
+
+
+def split_range(start: int, end: int) -> list[tuple[int, int]]:
+    """
+    split the positions from start to end (exclusive) into maximal
+    aligned blocks, as (level, position) in order
+    """
+    blocks = []
+    while start < end:
+        level = 0
+        while start % (2 << level) == 0 and start + (2 << level) <= end:
+            level += 1
+        blocks.append((level, start >> level))
+        start += 1 << level
+    return blocks
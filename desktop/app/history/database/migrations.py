@@ -0,0 +1,54 @@
+# schema migrations of the storage file
+# create_all only creates missing tables, so changes on existing
+# tables (e.g. new indexes) are applied here
+# the schema version is stored in the `user_version` pragma of SQLite,
+# and MIGRATIONS[i] upgrades the schema from version i to i+1
+
+from sqlalchemy import Engine, Connection, text
+from .models import CONFIRMED_OPERATION_TABLE, HISTORY_METADATA_TABLE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def unique_serial_num(connection: Connection):
+    """
+    Make serial_num of confirmed operations unique.
+    Overwriting used to leave the superseded operations in the table,
+    which share serial nums with the current ones, so the operations
+    unreachable from the head are removed first.
+    """
+    head_id = connection.execute(
+        text(f"SELECT head_id FROM {HISTORY_METADATA_TABLE} LIMIT 1")).scalar()
+    links = {row[0]: row[1] for row in connection.execute(
+        text(f"SELECT id, next_id FROM {CONFIRMED_OPERATION_TABLE}"))}
+
+    reachable = set()
+    curr = head_id
+    while curr in links and curr not in reachable:
+        reachable.add(curr)
+        curr = links[curr]
+
+    unreachable = [{"id": node_id} for node_id in links if node_id not in reachable]
+    if unreachable:
+        logger.info(f"Removing {len(unreachable)} unreachable confirmed operations")
+        connection.execute(
+            text(f"DELETE FROM {CONFIRMED_OPERATION_TABLE} WHERE id = :id"), unreachable)
+    connection.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{CONFIRMED_OPERATION_TABLE}_serial_num "
+        f"ON {CONFIRMED_OPERATION_TABLE} (serial_num)"))
+
+
+MIGRATIONS = [
+    unique_serial_num,
+]
+
+
+def migrate(engine: Engine):
+    with engine.begin() as connection:
+        version = connection.execute(text("PRAGMA user_version")).scalar() or 0
+        for i in range(version, len(MIGRATIONS)):
+            logger.info(f"Migrating storage schema to version {i+1}")
+            MIGRATIONS[i](connection)
+        if version < len(MIGRATIONS):
+            connection.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
@@ -1,4 +1,5 @@
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import Integer, String, Text, ForeignKey
+from typing import Union
 from sqlalchemy.orm import DeclarativeBase, relationship,\
                            mapped_column, Mapped
 
@@ -6,6 +7,9 @@ CONFIRMED_OPERATION_TABLE = "confirmed_operation"
 HISTORY_METADATA_TABLE = "history_metadata"
 PENDING_OPERATION_TABLE = "pending_operations"
 QUEUE_METADATA_TABLE = "queue_metadata"
+TREE_SNAPSHOT_TABLE = "tree_snapshot"
+MERKLE_NODE_TABLE = "merkle_node"
+HISTORY_BASELINE_TABLE = "history_baseline"
 
 class Base(DeclarativeBase):
     pass
@@ -15,8 +19,8 @@ class ConfirmedOperationNode(Base):
     __tablename__ = CONFIRMED_OPERATION_TABLE
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    serial_num: Mapped[int] = mapped_column(Integer, nullable=False)
-    operation: Mapped[str] = mapped_column(String(512), nullable=False)
+    serial_num: Mapped[int] = mapped_column(Integer, nullable=False, unique=True, index=True)
+    operation: Mapped[Union[str, bytes]] = mapped_column(String(512), nullable=False) # JSON or compact binary, see codec
     history_hash: Mapped[str] = mapped_column(String(64), nullable=False)
 
     next_id: Mapped[int] = mapped_column(Integer, ForeignKey(f"{CONFIRMED_OPERATION_TABLE}.id"), nullable=False)
@@ -36,7 +40,7 @@ class PendingOperationNode(Base):
     __tablename__ = PENDING_OPERATION_TABLE
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
-    operation: Mapped[str] = mapped_column(String(512), nullable=False)
+    operation: Mapped[Union[str, bytes]] = mapped_column(String(512), nullable=False) # JSON or compact binary, see codec
 
 
 class PendingQueueMetadata(Base):
@@ -49,3 +53,31 @@ class PendingQueueMetadata(Base):
     # tail = relationship("PendingOperationNode", foreign_keys=[tail_id], uselist=False)
     starting_serial_num: Mapped[int] = mapped_column(Integer, ForeignKey(f"{CONFIRMED_OPERATION_TABLE}.serial_num"), nullable=False)
 
+
+class TreeSnapshot(Base):
+    __tablename__ = TREE_SNAPSHOT_TABLE
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    serial_num: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
+    history_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    tree: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+class MerkleNode(Base):
+    __tablename__ = MERKLE_NODE_TABLE
+
+    level: Mapped[int] = mapped_column(Integer, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hash: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+class HistoryBaseline(Base):
+    __tablename__ = HISTORY_BASELINE_TABLE
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    serial_num: Mapped[int] = mapped_column(Integer, nullable=False)
+    history_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    tree: Mapped[str] = mapped_column(Text, nullable=False)
+    # JSON list of the hashes of the merkle blocks covering the squashed
+    # operations, in the order of split_range
+    index_blocks: Mapped[str] = mapped_column(Text, nullable=False, default="[]")
@@ -1,8 +1,9 @@
 from __future__ import annotations
 from PyQt5.QtCore import QObject, pyqtSignal
 from sqlalchemy.orm import Session
+from typing import Callable
 from sqlalchemy import select
-from app.history.core import Operation
+from app.history.core import Operation, encode_operation
 from .models import PendingQueueMetadata, PendingOperationNode
 
 class PendingQueue(QObject):
@@ -16,10 +17,16 @@ class PendingQueue(QObject):
     after which the pending operations are added.
     This pointer helps us to recover the history when overwriting the
     confirmed history.
+    Operations are stored in compact binary form if `compact` is set.
+    Every change is committed through the committer, with which
+    Database groups commits or defers them to a transaction.
     """
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, compact: bool = False):
         super().__init__()
         self.session = session
+        self.compact = compact
+        # Database replaces it to group or sync the commits
+        self.committer: Callable[[], None] = self.session.commit
         self.metadata = self.session.query(PendingQueueMetadata).first()
         if self.metadata is None:
             self.metadata = PendingQueueMetadata(
@@ -28,6 +35,9 @@ class PendingQueue(QObject):
             self.session.add(self.metadata)
             self.session.commit()
         
+    def commit(self):
+        self.committer()
+
     def is_empty(self):
         assert self.metadata is not None
         return self.metadata.head_id == self.metadata.tail_id
@@ -52,7 +62,7 @@ class PendingQueue(QObject):
         if self.metadata.head_id == self.metadata.tail_id:
             return None
         query = select(PendingOperationNode).\
-                where(PendingOperationNode.id == self.metadata.tail_id)
+                where(PendingOperationNode.id == self.metadata.tail_id-1)
         node = self.session.scalars(query).first()
         return node
     
@@ -67,15 +77,15 @@ class PendingQueue(QObject):
     def set_starting_serial(self, starting_serial_num: int):
         assert self.metadata is not None
         self.metadata.starting_serial_num = starting_serial_num
-        self.session.commit()
+        self.commit()
         return 0
     
     def push(self, operation: Operation):
         assert self.metadata is not None
-        node = PendingOperationNode(operation=operation.stringify())
+        node = PendingOperationNode(operation=encode_operation(operation, self.compact))
         self.session.add(node)
         self.metadata.tail_id += 1
-        self.session.commit()
+        self.commit()
         self.updated.emit()
 
     def pop(self):
@@ -84,7 +94,7 @@ class PendingQueue(QObject):
             return None
         head = self.get_head()
         self.metadata.head_id += 1
-        self.session.commit()
+        self.commit()
         self.updated.emit()
         return head
     
@@ -93,13 +103,17 @@ class PendingQueue(QObject):
         if self.metadata.head_id == self.metadata.tail_id:
             return None
         tail = self.get_tail()
+        # a new push takes the id after the last row, so drop it now
+        if tail is not None:
+            self.session.delete(tail)
+            self.session.flush()
         self.metadata.tail_id -= 1
-        self.session.commit()
+        self.commit()
         self.updated.emit()
     
     def clear(self):
         assert self.metadata is not None
         self.metadata.head_id = self.metadata.tail_id
-        self.session.commit()
+        self.commit()
         self.updated.emit()
         return 0
\ No newline at end of file
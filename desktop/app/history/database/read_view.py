@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Optional, NamedTuple, Iterator
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.history.core import StoredOperation
+from .models import ConfirmedHistoryMetadata, ConfirmedOperationNode,\
+                    PendingQueueMetadata, PendingOperationNode, HistoryBaseline
+
+
+@contextmanager
+def open_read_view(session: Session) -> Iterator['ReadView']:
+    """
+    open a read view on the session, which is closed afterwards
+    """
+    try:
+        # pin the snapshot of the database until the view is closed
+        session.connection().exec_driver_sql("BEGIN")
+        yield ReadView(session)
+    finally:
+        session.rollback()
+        session.close()
+
+
+class ConfirmedHead(NamedTuple):
+    serial_num: int
+    history_hash: str
+
+
+class ReadView:
+    """
+    Read view is a read-only view of the history for the threads other
+    than the main one, which writes through the session of Database.
+    A read view works on a session of its own thread, and everything
+    read through it comes from the same snapshot of the database, while
+    the main thread keeps writing.
+    It returns plain values instead of ORM objects, so nothing read
+    is bound to its session after the view is closed.
+    Get one by Database.read_view().
+    """
+    def __init__(self, session: Session):
+        self.session = session
+
+    def confirmed_head(self) -> Optional[ConfirmedHead]:
+        query = select(ConfirmedOperationNode.serial_num, ConfirmedOperationNode.history_hash).\
+                join(ConfirmedHistoryMetadata, ConfirmedHistoryMetadata.head_id == ConfirmedOperationNode.id)
+        row = self.session.execute(query).first()
+        if row is None:
+            return None
+        return ConfirmedHead(row[0], row[1])
+
+    def baseline(self) -> Optional[ConfirmedHead]:
+        """
+        the serial num and history hash of the baseline, before which
+        no operation is stored
+        """
+        row = self.session.execute(select(HistoryBaseline.serial_num, HistoryBaseline.history_hash)).first()
+        if row is None:
+            return None
+        return ConfirmedHead(row[0], row[1])
+
+    def length(self) -> int:
+        head = self.confirmed_head()
+        return 0 if head is None else head.serial_num
+
+    def hashcodes_at(self, serial_nums: list[int]) -> dict[int, str]:
+        """
+        history hashes of the given serial nums, in a single query
+        the serial nums not in confirmed history are left out
+        """
+        query = select(ConfirmedOperationNode.serial_num, ConfirmedOperationNode.history_hash).\
+                where(ConfirmedOperationNode.serial_num.in_(serial_nums))
+        return {serial_num: history_hash for serial_num, history_hash in self.session.execute(query)}
+
+    def pending_window(self, count: int) -> list[StoredOperation]:
+        """
+        the stored operations of the first `count` nodes of pending queue
+        """
+        metadata = self.session.execute(
+            select(PendingQueueMetadata.head_id, PendingQueueMetadata.tail_id)
+        ).first()
+        if metadata is None:
+            return []
+        head_id, tail_id = metadata
+        query = select(PendingOperationNode.operation).\
+                where(PendingOperationNode.id >= head_id,
+                      PendingOperationNode.id < min(tail_id, head_id + count)).\
+                order_by(PendingOperationNode.id.asc())
+        return list(self.session.scalars(query))
@@ -0,0 +1,65 @@
+from __future__ import annotations
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.history.core import Tree
+from typing import Union
+from .models import TreeSnapshot, HistoryBaseline
+import json, logging
+
+
+class SnapshotStore:
+    """
+    Snapshot store keeps serialized trees (checkpoints) of the
+    confirmed history at some serial nums, so that tree loader can
+    start from the newest checkpoint instead of replaying from serial 1.
+    A snapshot is keyed by the serial num and history hash of the
+    last confirmed operation it contains. It is only valid while that
+    hash still matches the confirmed history, because the confirmed
+    history may be overwritten.
+    Snapshots never contain pending operations.
+    """
+    def __init__(self, session: Session):
+        self.session = session
+        self.logger = logging.getLogger(__name__)
+
+    def get_all(self):
+        """
+        The result is ordered by serial_num descending
+        """
+        query = select(TreeSnapshot).\
+                order_by(TreeSnapshot.serial_num.desc())
+        return self.session.scalars(query).all()
+
+    def load(self, snapshot: Union[TreeSnapshot, HistoryBaseline], tree_class: type[Tree] = Tree) -> Tree:
+        return tree_class.from_dict(json.loads(snapshot.tree))
+
+    def save(self, serial_num: int, history_hash: str, tree: Tree):
+        self.logger.debug(f"Saving tree snapshot at serial {serial_num}")
+        query = select(TreeSnapshot).\
+                where(TreeSnapshot.serial_num == serial_num)
+        snapshot = self.session.scalars(query).first()
+        if snapshot is None:
+            snapshot = TreeSnapshot(serial_num=serial_num)
+            self.session.add(snapshot)
+        snapshot.history_hash = history_hash
+        snapshot.tree = dump_tree(tree)
+        self.session.commit()
+        return snapshot
+
+    def remove(self, snapshots: list[TreeSnapshot]):
+        if not snapshots:
+            return
+        for snapshot in snapshots:
+            self.session.delete(snapshot)
+        self.session.commit()
+
+    def evict(self, max_count: int):
+        """
+        keep only the newest `max_count` snapshots
+        """
+        self.remove(list(self.get_all()[max_count:]))
+
+
+
+def dump_tree(tree: Tree) -> str:
+    return json.dumps(tree.to_dict(), separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,66 @@
+# storage profiles of the SQLite file
+# "durable": rollback journal, every commit is synced to disk,
+#   i.e. the SQLite defaults
+# "fast": write-ahead log, and commits are synced at checkpoints only
+#   (synchronous=NORMAL), so a power loss may lose the last commits but
+#   never corrupts the file; Database commits the changes of pending
+#   queue in groups under this profile, while the commits of confirmed
+#   history are still synced one by one (synchronous=FULL)
+
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.orm import Session
+import os
+
+DURABLE = "durable"
+FAST = "fast"
+
+PROFILES = {
+    DURABLE: {"journal_mode": "DELETE", "synchronous": "FULL"},
+    FAST: {"journal_mode": "WAL", "synchronous": "NORMAL"},
+}
+
+
+def create_storage_engine(db_url: str, profile: str) -> Engine:
+    """
+    create an engine whose connections are set up for the profile
+    unknown profiles fall back to durable
+    """
+    pragmas = PROFILES.get(profile, PROFILES[DURABLE])
+    engine = create_engine(db_url)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # can only be set on a new file, the others get it at the next VACUUM (see collector.py)
+        cursor.execute("PRAGMA page_count")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+    return engine
+
+
+def synced_commit(session: Session, profile: str):
+    """
+    commit, and make sure the commit is synced to disk
+    whatever the profile is
+    """
+    session.commit()
+    if PROFILES.get(profile, PROFILES[DURABLE])["synchronous"] == "FULL":
+        return
+    # the log is synced at checkpoints only under synchronous=NORMAL,
+    # so sync it now, as synchronous=FULL does on every commit
+    # (the safety level can't be raised inside a transaction)
+    database = session.get_bind().url.database
+    if not database:
+        return
+    try:
+        fd = os.open(database + "-wal", os.O_RDWR)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+from typing import Iterator, NamedTuple, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.history.core import canonical_form, StoredOperation
+from .models import ConfirmedHistoryMetadata, ConfirmedOperationNode, HistoryBaseline
+import hashlib, multiprocessing, os
+
+CHUNK = 2000 # rows canonicalized at a time
+
+
+class VerifyResult(NamedTuple):
+    checked: int # the serial num up to which the hashes are right
+    length: int # the serial num of the head
+    corrupted: Optional[int] # the first corrupted serial num, None if intact
+    baseline: int = 0 # the serial num of the baseline the chain starts from
+
+    def summary(self) -> str:
+        if self.baseline == 0:
+            verified = f"{self.checked} operations"
+        elif self.checked > self.baseline:
+            verified = f"serials {self.baseline+1}..{self.checked} from baseline {self.baseline}"
+        else:
+            verified = f"nothing after baseline {self.baseline}"
+        if self.corrupted is None:
+            return f"Verified {verified}, history intact."
+        return f"History corrupted at serial {self.corrupted} " \
+               f"(verified {verified}, of {self.length})."
+
+
+def canonical_forms(chunk: list[StoredOperation]) -> list[str]:
+    # runs in the worker processes, so it must stay at module level
+    return [canonical_form(data) for data in chunk]
+
+
+def verify_chain(session: Session, workers: int = 1) -> VerifyResult:
+    """
+    Stream the confirmed operations in serial order, and recompute the
+    hash chain from their canonical forms, stopping at the first
+    serial num whose stored hash doesn't match (or which is missing).
+    Operations stored in binary are canonicalized by a pool of
+    `workers` processes (at most one per cpu) when workers > 1, a few
+    chunks ahead of the hashing, which is sequential by nature.
+    With a baseline, the chain is checked from the operation after it,
+    on the hash of the baseline.
+    """
+    head_id = session.scalar(select(ConfirmedHistoryMetadata.head_id))
+    length = session.scalar(select(ConfirmedOperationNode.serial_num).\
+                            where(ConfirmedOperationNode.id == head_id)) or 0
+
+    start = 1
+    base = 0
+    prev = b""
+    baseline = session.execute(select(HistoryBaseline.serial_num, HistoryBaseline.history_hash)).first()
+    if baseline is not None:
+        serial_num, history_hash = baseline
+        stored = session.scalar(select(ConfirmedOperationNode.history_hash).\
+                                where(ConfirmedOperationNode.serial_num == serial_num))
+        if stored != history_hash:
+            return VerifyResult(serial_num-1, length, serial_num, serial_num)
+        base = serial_num
+        start = serial_num + 1
+        prev = history_hash.encode('ascii')
+
+    query = select(ConfirmedOperationNode.serial_num,
+                   ConfirmedOperationNode.operation,
+                   ConfirmedOperationNode.history_hash).\
+            where(ConfirmedOperationNode.serial_num.between(start, length)).\
+            order_by(ConfirmedOperationNode.serial_num.asc())
+    result = session.execute(query, execution_options={"yield_per": CHUNK})
+    try:
+        expected = start
+        for serial_nums, forms, hashes in iter_chunks(result, workers):
+            for serial_num, form, history_hash in zip(serial_nums, forms, hashes):
+                if serial_num != expected:
+                    return VerifyResult(expected-1, length, expected, base)
+                digest = hashlib.sha256(prev)
+                digest.update(form.encode('utf-8'))
+                hexdigest = digest.hexdigest()
+                if hexdigest != history_hash:
+                    return VerifyResult(expected-1, length, serial_num, base)
+                prev = hexdigest.encode('ascii')
+                expected += 1
+        if expected <= length:
+            return VerifyResult(expected-1, length, expected, base)
+        return VerifyResult(length, length, None, base)
+    finally:
+        result.close()
+
+
+def iter_chunks(result, workers: int) -> Iterator[tuple[list[int], list[str], list[str]]]:
+    """
+    yield (serial nums, canonical forms, history hashes) chunk by chunk
+    """
+    if workers <= 1:
+        for rows in result.partitions(CHUNK):
+            serial_nums, data, hashes = zip(*rows)
+            yield list(serial_nums), canonical_forms(list(data)), list(hashes)
+        return
+
+    # spawned rather than forked, as the app runs several threads
+    with ProcessPoolExecutor(min(workers, os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        # bounded, so that a large history isn't read into memory at once
+        ahead: deque[tuple[list[int], Future, list[str]]] = deque()
+        for rows in result.partitions(CHUNK):
+            serial_nums, data, hashes = zip(*rows)
+            ahead.append((list(serial_nums), pool.submit(canonical_forms, list(data)), list(hashes)))
+            if len(ahead) >= workers * 2:
+                serial_nums, forms, hashes = ahead.popleft()
+                yield serial_nums, forms.result(), hashes
+        while ahead:
+            serial_nums, forms, hashes = ahead.popleft()
+            yield serial_nums, forms.result(), hashes
@@ -1,8 +1,9 @@
-from PyQt5.QtCore import QObject, pyqtSignal, QThread
+from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 from PyQt5.QtWidgets import QMessageBox
 from app.requester import Requester
 from app.history.database import Database
-from app.history.core import Operation, parse_operation, Tree, OperationType, Status, Node
+from app.history.replayer import replay, replay_until, ReplayResult, ReplayThread
+from app.history.core import Operation, decode_operation, Tree, ColumnarTree, OperationType, Status, StoredOperation, canonical_form
 from app.globals import context
 from typing import cast, Optional
 import logging
@@ -17,8 +18,13 @@ class TreeLoader(QObject):
     In the first case, we calls an HTTP API of server, to overwrite the
     confirmed history, and synchronize it later.
     In the second case, we pop the head of the pending queue.
+    Usually only a few operations are added between two updates of
+    the database, so the loader only applies these new operations
+    onto its tree, and falls back to a full reload when the history
+    diverges from what the tree has been built from.
     """
     reloaded = pyqtSignal()
+    changed = pyqtSignal(list) # identities of the nodes changed by an incremental update
 
     def __init__(self,
                  database: Database,
@@ -30,108 +36,250 @@ class TreeLoader(QObject):
 
         self.logger = logging.getLogger(__name__)
 
+        # the history which the tree has been built from:
+        # confirmed operations up to confirmed_serial, followed by
+        # applied_pending, a list of (pending node id, stored operation)
+        # applied_pending is None when the tree is not built successfully
+        self.confirmed_serial = 0
+        self.confirmed_hash = ""
+        self.checkpoint_serial = 0
+        self.applied_pending: Optional[list[tuple[int, StoredOperation]]] = None
+
+        self.tree: Tree = None # type: ignore[assignment] # built by the first reload
+        self.replay_thread: Optional[ReplayThread] = None
+        self.reload_requested = False
+
         self.reload()
-        self.database.updated.connect(self.reload)
-    
-    def reload(self):
-        self.tree = Tree()
-        operation_stack: list[Operation] = []
+        self.database.updated.connect(self.update)
+
+    def update(self):
+        """
+        bring the tree up to date with the database
+        """
+        if self.replay_thread is not None:
+            self.reload_requested = True
+            return
+        if self.applied_pending is None or \
+                not context.settings_manager.get("history/incrementalReload", type=bool):
+            self.reload()
+            return
+
+        changed = self.apply_delta()
+        if changed is None:
+            self.logger.debug("History diverged, reloading the tree.")
+            self.reload()
+            return
+
+        if changed:
+            self.changed.emit(changed)
+        self.finish_loading(reloaded=False)
+
+    def apply_delta(self) -> Optional[list[str]]:
+        """
+        apply the operations added since the last update onto the tree
+        :return: the identities of changed nodes; None when the history
+            has diverged and the tree must be reloaded
+        """
+        assert self.applied_pending is not None
+        changed: set[str] = set()
+
+        # new confirmed operations
+        head = self.database.confirmed_history.get_head()
+        head_serial = 0 if head is None else head.serial_num
+        if head_serial < self.confirmed_serial:
+            return None
+        if self.confirmed_serial != 0:
+            node = self.database.confirmed_history.get_by_serial_num(self.confirmed_serial)
+            if node is None or node.history_hash != self.confirmed_hash:
+                return None
+
+        for _, data, op in self.database.bulk_reader.confirmed(self.confirmed_serial + 1, head_serial):
+            if self.applied_pending:
+                # our own operation is confirmed, which is applied already
+                applied = self.applied_pending[0][1]
+                if applied != data and canonical_form(applied) != op.stringify():
+                    return None
+                self.applied_pending.pop(0)
+            else:
+                changed |= self.changed_nodes(op)
+                if op.apply(self.tree) != 0:
+                    return None
+        if head is not None:
+            self.confirmed_serial = head.serial_num
+            self.confirmed_hash = head.history_hash
+            if not self.applied_pending:
+                self.save_checkpoint()
+
+        # new pending operations
+        # pending nodes are never changed once pushed, so only the nodes
+        # after the applied ones are read
+        metadata = self.database.pending_queue.metadata
+        assert metadata is not None
+        # popped but not confirmed yet, the confirmation follows right after popping
+        in_flight = [entry for entry in self.applied_pending if entry[0] < metadata.head_id]
+        next_id = self.applied_pending[-1][0] + 1 if self.applied_pending else metadata.head_id
+        if next_id > metadata.tail_id:
+            # removed from the tail
+            return None
+        pending = self.database.bulk_reader.pending(max(next_id, metadata.head_id), metadata.tail_id)
+        for node_id, data, op in pending:
+            changed |= self.changed_nodes(op)
+            if op.apply(self.tree) != 0:
+                return None
+            self.applied_pending.append((node_id, data))
 
-        # get all the operations
+        if in_flight:
+            QTimer.singleShot(0, self.settle)
+        return list(changed)
+
+    def settle(self):
+        """
+        reload if popped pending operations never got confirmed
+        """
         assert self.database.pending_queue.metadata is not None
-        pending = [parse_operation(node.operation) for node in self.database.pending_queue.get_all()]
-        pending.reverse()
-        operation_stack += cast(list[Operation], pending)
-
-        curr = self.database.confirmed_history.get_head()
-        while curr is not None:
-            op = parse_operation(curr.operation)
-            assert op is not None
-            operation_stack.append(op)
-            curr = self.database.confirmed_history.\
-                get_by_id(curr.next_id)
-        
-        while len(operation_stack) > 0:
-            op = operation_stack.pop()
-            code = op.apply(self.tree)
-            if code != 0:
-                # conflict
-                self.logger.info("Conflict occured.")
-                self.process_conflict(op)
-                return
-        
-        # no conflict
+        head_id = self.database.pending_queue.metadata.head_id
+        if self.applied_pending is not None and \
+                any(entry[0] < head_id for entry in self.applied_pending):
+            self.reload()
+
+    def changed_nodes(self, operation: Operation) -> set[str]:
+        """
+        the identities of nodes that an operation is going to change,
+        which must be called before applying it
+        """
+        payload = operation.payload
+        if operation.op_type == OperationType.ADD_NODE:
+            return {payload["parent_node_id"], payload["new_node_id"]} # type: ignore
+
+        node_id = payload["node_id"] # type: ignore
+        result = {node_id}
+        node = self.tree.get_node_by_id(node_id)
+        if node is None:
+            return result
+        if operation.op_type == OperationType.REOPEN_NODE:
+            curr = node.parent
+            while curr is not None and curr.status == Status.COMPLETED:
+                result.add(curr.identity)
+                curr = curr.parent
+        elif node.parent is not None:
+            result.add(node.parent.identity)
+        if operation.op_type == OperationType.MOVE_NODE:
+            result.add(payload["new_parent_id"]) # type: ignore
+        return result
+
+    def save_checkpoint(self):
+        """
+        save a snapshot of the tree, which must contain confirmed operations only
+        """
+        interval = context.settings_manager.get("history/checkpointInterval", type=int)
+        if interval <= 0 or self.confirmed_serial - self.checkpoint_serial < interval:
+            return
+        self.database.snapshot_store.save(self.confirmed_serial, self.confirmed_hash, self.tree)
+        max_count = context.settings_manager.get("history/maxSnapshots", type=int)
+        self.database.snapshot_store.evict(max_count)
+        self.checkpoint_serial = self.confirmed_serial
+
+    def squash(self, serial_num: int):
+        """
+        squash the confirmed operations before serial_num into a baseline,
+        so that they are no longer stored or replayed
+        the tree is not changed, as the history stays the same
+        """
+        self.database.flush()
+        tree = replay_until(self.database.session, serial_num)
+        self.database.confirmed_history.squash(serial_num, tree)
+        self.database.snapshot_store.remove([
+            snapshot for snapshot in self.database.snapshot_store.get_all()
+            if snapshot.serial_num < serial_num
+        ])
+
+    def finish_loading(self, reloaded: bool = True):
+        """
+        :param reloaded: whether the tree is rebuilt, rather than changed
+            in place, which is reported by `changed` already
+        """
         semaphore = context.current_app.syncer.network_connector.reconnect_waiting_for_solving_conflicts # type: ignore
         if semaphore is not None:
             semaphore.release()
-        self.reloaded.emit()
-        head = self.database.confirmed_history.get_head() 
-        self.database.pending_queue.set_starting_serial(1 if head is None else head.serial_num + 1)
+        if reloaded:
+            self.reloaded.emit()
+        self.database.pending_queue.set_starting_serial(self.confirmed_serial + 1)
     
-    def check(self, operation: Operation):
+    def reload(self):
         """
-        check if an operation is allowed
+        rebuild the tree from the whole history
+        The first load runs in place, since everyone needs a tree.
+        Afterwards the replay runs on a subthread and the new tree is
+        swapped in when it's finished, while the old one stays readable.
+        Reloads requested during a replay are coalesced into one
+        follow-up reload.
         """
-        if operation.op_type == OperationType.ADD_NODE:
-            parent_node_id = operation.payload["parent_node_id"] # type: ignore
-            new_node_name = operation.payload["new_node_name"] # type: ignore
-            parent_node = self.tree.get_node_by_id(parent_node_id)
-            if parent_node is None:
-                return False
-            if new_node_name in [child.name for child in parent_node.children]:
-                return False
-        elif operation.op_type == OperationType.REOPEN_NODE:
-            node_id = operation.payload["node_id"] # type: ignore
-            node = self.tree.get_node_by_id(node_id)
-            if node is None or node.status != Status.COMPLETED:
-                return False
-        elif operation.op_type == OperationType.COMPLETE_NODE:
-            node_id = operation.payload["node_id"] # type: ignore
-            node = self.tree.get_node_by_id(node_id)
-            if node is None or not node.is_ready():
-                return False
-            if node.status == Status.COMPLETED:
-                return False
-        elif operation.op_type == OperationType.REMOVE_NODE:
-            node_id = operation.payload["node_id"] # type: ignore
-            node = self.tree.get_node_by_id(node_id)
-            if node is None:
-                return False
-            if node.children or (node.parent is None):
-                return False
-        elif operation.op_type == OperationType.REMOVE_SUBTREE:
-            node_id = operation.payload["node_id"] # type: ignore
-            node = self.tree.get_node_by_id(node_id)
-            if node is None:
-                return False
-            if node.parent is None:
-                return False
-        elif operation.op_type == OperationType.MOVE_NODE:
-            node_id = operation.payload["node_id"] # type: ignore
-            new_parent_id = operation.payload["new_parent_id"] # type: ignore
-            node = self.tree.get_node_by_id(node_id)
-            if node is None or node.parent is None:
-                return False
-
-            new_parent = self.tree.get_node_by_id(new_parent_id)
-            if new_parent is None:
-                return False
-
-            # you can't move a node to its child
-            curr: Optional[Node] = new_parent
-            while curr is not None and curr.identity != self.tree.root.identity:
-                if curr == node:
-                    return False
-                curr = curr.parent
-            
-            if any([child.name == node.name for child in new_parent.children]):
-                return False
-        else:
-            return False
+        self.applied_pending = None
+        if self.replay_thread is not None:
+            self.reload_requested = True
+            return
+
+        tree_class = self.tree_class()
+        if self.tree is None or \
+                not context.settings_manager.get("history/backgroundReload", type=bool):
+            self.adopt(replay(self.database.session, tree_class))
+            return
+
+        self.replay_thread = ReplayThread(self.database.engine, tree_class)
+        self.replay_thread.replayed.connect(self.on_replayed)
+        self.replay_thread.finished.connect(self.replay_thread.deleteLater)
+        self.replay_thread.start()
+
+    def tree_class(self) -> type[Tree]:
+        return ColumnarTree if context.settings_manager.get("history/columnarTree", type=bool) else Tree
 
-        return True
+    def on_replayed(self, result: Optional[ReplayResult]):
+        self.replay_thread = None
+        if self.reload_requested:
+            # the history has changed during the replay
+            self.reload_requested = False
+            self.reload()
+            return
+        if result is None:
+            # replay in place, so that the error surfaces here
+            result = replay(self.database.session, self.tree_class())
+        self.adopt(result)
 
+    def adopt(self, result: ReplayResult):
+        """
+        take over a replayed tree
+        """
+        if result.stale_snapshots:
+            self.database.snapshot_store.remove([
+                snapshot for snapshot in self.database.snapshot_store.get_all()
+                if snapshot.serial_num in result.stale_snapshots
+            ])
+
+        if result.conflict is not None:
+            self.logger.info("Conflict occured.")
+            self.process_conflict(result.conflict)
+            return
+
+        self.tree = result.tree
+        self.confirmed_serial = result.confirmed_serial
+        self.confirmed_hash = result.confirmed_hash
+        self.checkpoint_serial = result.base_serial
+        # the pending operations are applied to the tree as well
+        if not result.pending:
+            self.save_checkpoint()
+
+        # no conflict
+        self.applied_pending = result.pending
+        self.finish_loading()
     
+    def check(self, operation: Operation):
+        """
+        check if an operation is allowed
+        """
+        # the caller's own pushes may not be notified yet
+        self.database.notify_now()
+        return self.tree.validate(operation)
+
     def process_conflict(self, operation: Operation):
         msg_box = QMessageBox()
         msg_box.setWindowTitle("Conflict")
@@ -156,16 +304,17 @@ Which solution do you prefer?
         if ans == 1:
             # overwrite
             assert self.database.pending_queue.metadata is not None
-            pending = [parse_operation(node.operation) for node in self.database.pending_queue.get_all()]
+            pending = [decode_operation(node.operation) for node in self.database.pending_queue.get_all()]
             starting_serial = self.database.pending_queue.metadata.starting_serial_num
             self.requester.overwrite(
                 starting_serial_num=starting_serial,
                 operations=cast(list[Operation], pending),
             )
-            self.database.pending_queue.clear()
-            self.database.confirmed_history.overwrite(
-                starting_serial_num=starting_serial,
-                operations=cast(list[Operation], pending),
-            )
+            with self.database.transaction():
+                self.database.pending_queue.clear()
+                self.database.confirmed_history.overwrite(
+                    starting_serial_num=starting_serial,
+                    operations=cast(list[Operation], pending),
+                )
             self.logger.info("Conflict resolve: overwrite.")
             return True
@@ -0,0 +1,140 @@
+# replaying the whole history into a fresh tree
+# a long history takes a while to replay, so the tree loader runs the
+# replay on a subthread, which works on its own SQL session and its own
+# tree, and never writes to the database, so it reads through bulk
+# reader and snapshot store only
+# the tree loader adopts the result on the main thread
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import Engine
+from app.history.core import Operation, Tree, StoredOperation
+from app.history.database.snapshot_store import SnapshotStore
+from app.history.database.bulk_reader import BulkReader
+from app.history.database.models import TreeSnapshot, HistoryBaseline
+from typing import Optional, Union, override
+import logging
+
+
+class ReplayResult:
+    """
+    A tree replayed from the history, and the history it is built from.
+    If a conflict occurs, `conflict` is the operation that failed,
+    and the tree is incomplete.
+    """
+    def __init__(self, tree: Tree):
+        self.tree = tree
+        self.confirmed_serial = 0
+        self.confirmed_hash = ""
+        self.base_serial = 0 # serial num of the checkpoint replayed from
+        self.pending: list[tuple[int, StoredOperation]] = []
+        self.conflict: Optional[Operation] = None
+        self.stale_snapshots: list[int] = [] # serial nums of snapshots left behind
+
+
+def replay(session: Session, tree_class: type[Tree] = Tree) -> ReplayResult:
+    """
+    replay the history read through the session into a new tree,
+    starting from the newest checkpoint matching the confirmed history
+    """
+    logger = logging.getLogger(__name__)
+    snapshot_store = SnapshotStore(session)
+    bulk_reader = BulkReader(session)
+
+    head = bulk_reader.confirmed_head()
+    head_serial = 0 if head is None else head[0]
+
+    base, stale = find_base(bulk_reader, snapshot_store, head_serial)
+    if base is None:
+        result = ReplayResult(tree_class())
+    else:
+        logger.debug(f"Replaying from checkpoint at serial {base.serial_num}")
+        result = ReplayResult(snapshot_store.load(base, tree_class))
+        result.base_serial = base.serial_num
+    result.stale_snapshots = stale
+
+    for _, _, op in bulk_reader.confirmed(result.base_serial + 1, head_serial):
+        if op.apply(result.tree) != 0:
+            result.conflict = op
+            return result
+    result.confirmed_serial = head_serial
+    result.confirmed_hash = "" if head is None else head[1]
+
+    head_id, tail_id = bulk_reader.pending_range()
+    for node_id, data, op in bulk_reader.pending(head_id, tail_id):
+        if op.apply(result.tree) != 0:
+            result.conflict = op
+            return result
+        result.pending.append((node_id, data))
+    return result
+
+
+def replay_until(session: Session, serial_num: int, tree_class: type[Tree] = Tree) -> Tree:
+    """
+    replay the confirmed operations up to serial_num into a new tree,
+    which raises ValueError if they conflict
+    """
+    snapshot_store = SnapshotStore(session)
+    bulk_reader = BulkReader(session)
+
+    base, _ = find_base(bulk_reader, snapshot_store, serial_num)
+    tree = tree_class() if base is None else snapshot_store.load(base, tree_class)
+    base_serial = 0 if base is None else base.serial_num
+    for serial, _, op in bulk_reader.confirmed(base_serial + 1, serial_num):
+        if op.apply(tree) != 0:
+            raise ValueError(f"Confirmed operation at serial {serial} conflicts")
+    return tree
+
+
+def find_base(bulk_reader: BulkReader,
+              snapshot_store: SnapshotStore,
+              serial_num: int) -> tuple[Optional[Union[TreeSnapshot, HistoryBaseline]], list[int]]:
+    """
+    find the newest checkpoint (or the baseline) up to serial_num
+    matching the confirmed history to replay from
+    :return: the checkpoint (None to replay from the start), and the
+        serial nums of the snapshots not matching the confirmed history
+    """
+    base = None
+    stale = []
+    snapshots = snapshot_store.get_all()
+    hashcodes = bulk_reader.hashcodes_at([snapshot.serial_num for snapshot in snapshots])
+    for snapshot in snapshots:
+        if hashcodes.get(snapshot.serial_num) != snapshot.history_hash:
+            # left behind by an overwritten history, or squashed
+            stale.append(snapshot.serial_num)
+        elif base is None and snapshot.serial_num <= serial_num:
+            base = snapshot
+
+    # the operations before the baseline are gone, so it's always a base
+    baseline = bulk_reader.baseline()
+    if baseline is not None and baseline.serial_num <= serial_num and \
+            (base is None or base.serial_num < baseline.serial_num):
+        base = baseline
+    return base, stale
+
+
+class ReplayThread(QThread):
+    """
+    Replay thread runs a replay once, on a session of its own.
+    `replayed` carries the ReplayResult, or None if the replay failed.
+    """
+    replayed = pyqtSignal(object)
+
+    def __init__(self, engine: Engine, tree_class: type[Tree], parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.tree_class = tree_class
+        self.logger = logging.getLogger(__name__)
+
+    @override
+    def run(self):
+        session = sessionmaker(bind=self.engine)()
+        try:
+            result = replay(session, self.tree_class)
+        except Exception:
+            self.logger.exception("Failed to replay the history.")
+            result = None
+        finally:
+            session.close()
+        self.replayed.emit(result)
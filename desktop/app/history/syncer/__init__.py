@@ -8,10 +8,10 @@
 
 from PyQt5.QtCore import QObject, pyqtSlot, QThread
 from app.history.database import Database
-from app.history.core import parse_operation, Operation
+from app.history.core import parse_operation, Operation, canonical_form
 from app.requester import Requester
 from .connector import NetworkConnector
-from typing import override
+from typing import override, cast
 import qasync, asyncio, logging
 
 
@@ -19,14 +19,32 @@ class ConnectionThread(QThread):
     def __init__(self, worker, parent=None):
         super().__init__(parent)
         self.worker = worker
+        self.loop = None
 
     @override
     def run(self):
         loop = qasync.QEventLoop(self)
         asyncio.set_event_loop(loop)
+        self.loop = loop
         loop.call_soon(self.worker.start)
         loop.run_forever()
 
+        # the tasks go first, so that none of them opens the session again
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.run_until_complete(self.worker.requester.close_http_session())
+        loop.close()
+
+    def stop(self):
+        """
+        stop the loop from another thread, and wait for the thread to end
+        """
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.wait()
+
 class Syncer(QObject):
     """
     Syncer is the manager of the subthread and controls the network connector.
@@ -45,9 +63,16 @@ class Syncer(QObject):
 
         self.network_connector.moveToThread(self.network_thread)
         self.network_connector.received.connect(self.on_receive)
+        self.network_connector.overwrite_requested.connect(self.on_overwrite_requested)
         self.network_thread.start()
 
         self.logger = logging.getLogger(__name__)
+
+    def stop(self):
+        """
+        stop the network thread, closing its connections
+        """
+        self.network_thread.stop()
     
     @pyqtSlot(dict)
     def on_receive(self, data):
@@ -57,8 +82,33 @@ class Syncer(QObject):
             assert operation is not None
             serial_num = data["serial_num"]
         
-            head = self.database.pending_queue.get_head()
-            # print("###", operation.stringify(), {} if head is None else head.operation)
-            if head is not None and operation.stringify() == head.operation:
-                self.database.pending_queue.pop()
-            self.database.confirmed_history.insert_at_head(operation, serial_num)
+            # popping our own operation and confirming it is one change
+            with self.database.transaction():
+                self.acknowledge(operation)
+                self.database.confirmed_history.insert_at_head(operation, serial_num)
+
+        elif data["action"] == "update_batch":
+            # a run of confirmed operations with consecutive serial nums
+            operations = [parse_operation(op_str) for op_str in data["operations"]]
+            assert all(operation is not None for operation in operations)
+            starting_serial_num = data["starting_serial_num"]
+
+            with self.database.transaction():
+                for operation in operations:
+                    self.acknowledge(operation) # type: ignore
+                self.database.confirmed_history.append_many(
+                    cast(list[Operation], operations), starting_serial_num)
+
+    def acknowledge(self, operation: Operation):
+        """
+        remove our own operation from pending queue when it's confirmed
+        """
+        head = self.database.pending_queue.get_head()
+        # print("###", operation.stringify(), {} if head is None else head.operation)
+        if head is not None and operation.stringify() == canonical_form(head.operation):
+            self.database.pending_queue.pop()
+
+    @pyqtSlot(int, list)
+    def on_overwrite_requested(self, starting_serial_num: int, operations: list):
+        self.logger.info(f"Overwriting confirmed history from serial {starting_serial_num}")
+        self.database.confirmed_history.overwrite(starting_serial_num, operations)
@@ -1,18 +1,26 @@
 from websockets import ClientConnection
-from PyQt5.QtCore import QObject, pyqtSignal, QSemaphore
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QSemaphore
 from app.history.database import Database
+from app.history.database.read_view import ConfirmedHead
 from app.requester import Requester
+from app.globals import context
 from .receiver import WebsocketReceiver
 from .sender import WebsocketSender
+from typing import Optional
 import asyncio, websockets, logging
 
+PROBES = 16 # the number of hashes compared in a single query
+
 class NetworkConnector(QObject):
     received = pyqtSignal(dict) # forward the signal from receiver
+    overwrite_requested = pyqtSignal(int, list) # starting serial num, operations
     """
     NetworkConnector runs on the subthread, and controls the sender
     and receiver.
     NetworkConnector processes the connections(websocket), and runs
     the asyncio event loop. It is like a central event dispatcher.
+    NetworkConnector reads the database through read views only, and
+    asks the syncer on the main thread to write.
     """
     def __init__(self,
                  database: Database,
@@ -24,8 +32,17 @@ class NetworkConnector(QObject):
         self.ws_sender = None
         self.ws = None
         self.reconnect_waiting_for_solving_conflicts = None
+        # read here on the main thread, not on the subthread
+        self.send_window = context.settings_manager.get("history/sendWindow", type=int)
 
         self.logger = logging.getLogger(__name__)
+        self.database.updated.connect(self.on_database_updated)
+
+    @pyqtSlot()
+    def on_database_updated(self):
+        # runs on the subthread, as the connector lives there
+        if self.ws_sender is not None:
+            self.ws_sender.wake()
     
     def start(self):
         asyncio.create_task(self.main())
@@ -58,7 +75,7 @@ class NetworkConnector(QObject):
         async with self.requester.build_websocket_connection() as ws:
             self.logger.info("Websocket connection build.")
             self.ws = ws
-            self.ws_sender = WebsocketSender(self.database, ws)
+            self.ws_sender = WebsocketSender(self.database, ws, self.send_window)
             self.ws_receiver = WebsocketReceiver(self.database, ws)
             self.ws_receiver.received.connect(self.received.emit)
             self.sending = asyncio.create_task(self.ws_sender.start())
@@ -69,12 +86,14 @@ class NetworkConnector(QObject):
     
     async def reconnect_init(self):
         self.logger.debug("Reconnect init")
-        length = self.requester.get_length()
+        length = await self.requester.get_length()
         if length == -1:
             return -1 
         
         flag = True # marking if the local history is identical with the remote one
-        head = self.database.confirmed_history.get_head()
+        with self.database.read_view() as view:
+            head = view.confirmed_head()
+            baseline = view.baseline()
         if length != (0 if head is None else head.serial_num):
             flag = False
         else:
@@ -85,7 +104,7 @@ class NetworkConnector(QObject):
                 if head is None:
                     flag = False
                 else:
-                    remote_head = self.requester.get_hashcodes([length])
+                    remote_head = await self.requester.get_hashcodes([length])
                     if remote_head is None:
                         return -1
                     if remote_head[0] != head.history_hash:
@@ -97,35 +116,17 @@ class NetworkConnector(QObject):
         self.logger.info("Difference detected, syncing with server")
         
         # find the latest shared operation
-        M = 10 # the number of operations in a single query
-        k = 0 # the serial num of the latest identical operation
-        curr = min(length, 0 if head is None else head.serial_num)
-        while curr > 0:
-            if curr < M:
-                serial_nums = list(range(1, curr+1))
-            else:
-                serial_nums = list(range(curr-M+1, curr+1))
-            
-            hashcodes = [
-                self.database.confirmed_history.get_by_serial_num(serial_num).history_hash # type: ignore
-                for serial_num in serial_nums
-            ]
-            remote_hashcodes = self.requester.get_hashcodes(serial_nums=serial_nums)
-            if remote_hashcodes is None:
-                return -1
-
-            for i in range(0, len(serial_nums)):
-                if hashcodes[i] == remote_hashcodes[i]:
-                    k = i
-            if k != 0:
-                break
-
-            curr -= M
+        k = await self.find_divergence(min(length, 0 if head is None else head.serial_num), baseline)
+        if k is None:
+            return -1
+        if baseline is not None and k < baseline.serial_num:
+            # diverged within the squashed operations, start over from serial 1
+            k = 0
 
         assert k != max(length, 0 if head is None else head.serial_num)
 
         requested_serial_nums = list(range(k+1, length+1))
-        remote_operations = self.requester.get_operations(requested_serial_nums)
+        remote_operations = await self.requester.get_operations(requested_serial_nums)
         if remote_operations is None:
             return -1
         
@@ -135,10 +136,51 @@ class NetworkConnector(QObject):
         # so we set this semaphore to wait until tree loader loads the tree,
         # and meanwhile solve the conflicts
         self.reconnect_waiting_for_solving_conflicts = QSemaphore(0)
-        self.database.confirmed_history.overwrite(k+1, remote_operations)
+        # only the main thread writes to the database
+        self.overwrite_requested.emit(k+1, remote_operations)
         self.reconnect_waiting_for_solving_conflicts.acquire()
         return 0
     
+    async def find_divergence(self, upper: int, baseline: Optional[ConfirmedHead] = None) -> Optional[int]:
+        """
+        Find the serial num of the latest operation shared with server,
+        no greater than upper (0 if none is shared).
+        The history hash chains the whole prefix, so if the hashes of a
+        serial num are identical, so is the history up to it. So the
+        serial nums matched are exactly 1..k, and k is searched by
+        comparing the hashes of a few serial nums per query: backwards
+        from upper exponentially first, as the histories usually diverge
+        near the head, then evenly across the range left.
+        The operations before the baseline aren't stored, but the hash of
+        the baseline tells whether they match.
+        :return: None on network errors
+        """
+        lo, hi = 0, upper+1 # lo is matched, hi isn't (or is beyond upper)
+        if baseline is not None and baseline.serial_num <= upper:
+            remote_hashcodes = await self.requester.get_hashcodes(serial_nums=[baseline.serial_num])
+            if remote_hashcodes is None:
+                return None
+            if remote_hashcodes[0] != baseline.history_hash:
+                return 0
+            lo = baseline.serial_num
+        probes = sorted(upper-(1<<i)+1 for i in range(PROBES) if upper-(1<<i)+1 > lo)
+        while hi - lo > 1:
+            with self.database.read_view() as view:
+                hashcodes = view.hashcodes_at(probes)
+            remote_hashcodes = await self.requester.get_hashcodes(serial_nums=probes)
+            if remote_hashcodes is None:
+                return None
+
+            for serial_num, remote_hashcode in zip(probes, remote_hashcodes):
+                if hashcodes.get(serial_num) != remote_hashcode:
+                    hi = serial_num
+                    break
+                lo = serial_num
+            
+            step = (hi - lo) / (PROBES + 1)
+            probes = sorted({lo + max(round(step * (i+1)), 1) for i in range(PROBES)} & set(range(lo+1, hi)))
+        return lo
+    
     async def check(self):
         """
         due to some reasons (for example, when client1 has finished
@@ -148,10 +190,11 @@ class NetworkConnector(QObject):
         """
         while self.ws is not None:
             print("checking")
-            head = self.database.confirmed_history.get_head()
-            length = self.requester.get_length()
+            with self.database.read_view() as view:
+                local_length = view.length()
+            length = await self.requester.get_length()
             
-            if length != (0 if head is None else head.serial_num):
+            if length != local_length:
                 # close connection to reconnect-init
                 self.logger.info("Check failed during websocket connection.")
                 await self.ws.close()
@@ -1,37 +1,105 @@
 from websockets import ClientConnection
 from PyQt5.QtCore import QObject
 from app.history.database import Database
-import json, asyncio, websockets
+from app.history.core import canonical_form
+import json, asyncio, websockets, hashlib, logging
+
+RETRANSMIT_TIMEOUT = 2.0 # seconds before the first retransmission
+MAX_RETRANSMIT_TIMEOUT = 30.0 # the timeout doubles up to this
+
 
 class WebsocketSender(QObject):
     """
     Sender runs on the subthread, and creates asyncio tasks.
-    Sender keeps sending operations from pending queue,
-    careless about what others are doing.
-    Sender only reads pending queue, while other components
-    will correctly operates pending queue.
+    Sender sends the operations at the head of pending queue whenever
+    the history changes, careless about what others are doing.
+    Sender only reads pending queue through read views, while other
+    components will correctly operates pending queue.
+    Up to `window` operations are in flight at a time, expecting
+    consecutive serial nums, so that a backlog is drained in a few
+    round trips. An operation is in flight until the server broadcasts
+    it back, which removes it from pending queue and acknowledges it.
+    If the head isn't acknowledged in time, the whole window is sent
+    again, with a timeout doubled each time. The server drops an
+    operation not expecting its head serial num, so resending is safe.
+    Every operation also carries the history hash expected before it,
+    chained from the confirmed head through the operations before it in
+    the window, and the server drops it unless that's the hash of its
+    head. So when another client goes first, the whole window is
+    dropped, and the operations are always confirmed in order.
     """
     def __init__(self,
                  database: Database,
-                 ws: ClientConnection):
+                 ws: ClientConnection,
+                 window: int = 1):
         super().__init__()
         self.database = database
         self.ws = ws
-    
+        self.window = max(window, 1)
+        self.wakeup = asyncio.Event()
+        # (operation, expected serial num, expected previous hash)
+        # sent and not acknowledged yet
+        self.in_flight: list[tuple[str, int, str]] = []
+        self.deadline = 0.0 # when to retransmit the window
+        self.retransmit_timeout = RETRANSMIT_TIMEOUT
+        self.logger = logging.getLogger(__name__)
+
+    def wake(self):
+        """
+        tell the sender that the history has changed
+        must be called on the thread of the sender
+        """
+        self.wakeup.set()
+
+    async def transmit(self, message: tuple[str, int, str]):
+        operation, expected_serial, expected_prev_hash = message
+        self.logger.debug(f"Sending operation expecting serial {expected_serial}")
+        await self.ws.send(json.dumps({
+            "action": "update",
+            "operation": operation,
+            "expected_serial_num": expected_serial,
+            "expected_prev_hash": expected_prev_hash,
+        }))
+
     async def send(self):
+        loop = asyncio.get_running_loop()
         while True:
-            print("sending")
-            head = self.database.pending_queue.get_head()
-            assert self.database.pending_queue.metadata is not None
-            chead = self.database.confirmed_history.get_head()
-            expected_serial = (0 if chead is None else chead.serial_num) + 1
-            if head is not None:
-                await self.ws.send(json.dumps({
-                    "action": "update",
-                    "operation": head.operation,
-                    "expected_serial_num": expected_serial,
-                }))
-            await asyncio.sleep(1)
+            self.wakeup.clear()
+            with self.database.read_view() as view:
+                window = view.pending_window(self.window)
+                head = view.confirmed_head()
+            length, prev_hash = (0, "") if head is None else head
+            messages = []
+            for data in window:
+                operation = canonical_form(data)
+                messages.append((operation, length + 1 + len(messages), prev_hash))
+                # the history hash after it, if it's confirmed as expected
+                prev_hash = hashlib.sha256((prev_hash + operation).encode('utf-8')).hexdigest()
+
+            timeout = None
+            if not messages:
+                self.in_flight = []
+            else:
+                if not self.in_flight or messages[0] != self.in_flight[0]:
+                    # the head is acknowledged, or the history has moved on
+                    self.retransmit_timeout = RETRANSMIT_TIMEOUT
+                    self.deadline = loop.time() + self.retransmit_timeout
+                elif loop.time() >= self.deadline:
+                    self.logger.info("Operations not acknowledged in time, retransmitting.")
+                    self.retransmit_timeout = min(self.retransmit_timeout * 2, MAX_RETRANSMIT_TIMEOUT)
+                    self.deadline = loop.time() + self.retransmit_timeout
+                    self.in_flight = []
+                sent = set(self.in_flight)
+                for message in messages:
+                    if message not in sent:
+                        await self.transmit(message)
+                self.in_flight = messages
+                timeout = max(self.deadline - loop.time(), 0)
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
     
     async def start(self):
         self.sending_task = asyncio.create_task(self.send())
@@ -11,12 +11,19 @@ from app.globals import context
 from app.history.core import Operation, parse_operation
 import websockets, requests, aiohttp, asyncio, logging
 
+REQUEST_TIMEOUT = 10 # seconds
+MAX_CONNECTIONS = 4 # concurrent connections of the asyncio requests
+KEEPALIVE_TIMEOUT = 30 # seconds an idle connection is kept
+
 class Requester(QObject):
     login_requested = pyqtSignal()
     """
     Requester proxys all the requests to server, processing
     authorization and other complexities.
     Running on main thread(because it calls GUI).
+    The requests made by the subthread are asynchronous, sharing one
+    pooled aiohttp session on the loop of the subthread, while the
+    blocking ones of the main thread share a requests session.
     """
 
     def __init__(self,
@@ -26,6 +33,9 @@ class Requester(QObject):
         self.user_manager = user_manager
         self.data_file = data_file
         self.user_manager.user_change.connect(self.on_user_change)
+        self.sync_session = requests.Session()
+        self.async_session: Optional[aiohttp.ClientSession] = None
+        self.async_session_loop: Optional[asyncio.AbstractEventLoop] = None
         self.login_requested.connect(self.request_login, Qt.QueuedConnection) # type: ignore
         with open(self.data_file, 'r') as f:
             self.access_token = f.read()
@@ -40,25 +50,101 @@ class Requester(QObject):
             with open(self.data_file, 'w') as f:
                 f.write(self.access_token)
 
+    def http_session(self) -> aiohttp.ClientSession:
+        """
+        the long-lived session of the asyncio requests, with a pool of
+        keep-alive connections
+        It belongs to the running loop (the one of the subthread), and is
+        created again if it's used on another loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self.async_session is not None and self.async_session_loop is not loop:
+            self.discard_http_session()
+        if self.async_session is None or self.async_session.closed:
+            self.async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS,
+                                               keepalive_timeout=KEEPALIVE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+            self.async_session_loop = loop
+        return self.async_session
+
+    def discard_http_session(self):
+        """
+        drop the session of another loop, closing it on that loop, where
+        its connections are
+        """
+        session, loop = self.async_session, self.async_session_loop
+        self.async_session = None
+        self.async_session_loop = None
+        if session is None or session.closed or loop is None:
+            return
+        if loop.is_closed():
+            self.logger.warning("The loop of the http session is closed before the session.")
+            return
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    async def close_http_session(self):
+        """
+        close the session of the running loop, before the loop stops
+        """
+        if self.async_session is None or \
+                self.async_session_loop is not asyncio.get_running_loop():
+            return
+        session = self.async_session
+        self.async_session = None
+        self.async_session_loop = None
+        await session.close()
+
+    def unauthorized(self):
+        self.access_token = ""
+        self.user_manager.logout()
+        self.login_requested.emit() # thread-safely call a login
+
+    async def request(self, method: str, url: str, payload=None):
+        """
+        send an authorized request through the shared session
+        :return: the JSON response; None when the network fails or the
+            token is rejected, in which case a login is requested
+        """
+        session = self.http_session()
+        try:
+            async with session.request(method, url, json=payload, headers={
+                "Authorization": f"Bearer {self.access_token}"
+            }) as response:
+                if response.status == 200:
+                    return await response.json()
+                elif response.status == 401:
+                    self.unauthorized()
+                    return None
+                else:
+                    self.logger.error(f"status_code: {response.status}")
+                    raise RuntimeError("Unknown Error")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return None
+
     async def health_check(self):
         # mock the offline status when logged out
         if self.access_token == "":
             return False
         url = context.settings_manager.get("internal/healthCheckURL")
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    return response.status == 200
+            async with self.http_session().get(url) as response:
+                return response.status == 200
         except Exception as e:
             return False
     
     def overwrite(self, starting_serial_num: int, operations: list[Operation]):
+        """
+        This is a blocking call, made on the main thread while the user
+        is resolving a conflict.
+        """
         self.logger.info("Overwriting remote history")
         if self.access_token == "":
             return -1
         url = context.settings_manager.get("internal/overwriteURL")
         try:
-            response = requests.post(
+            response = self.sync_session.post(
                 url,
                 json={
                     "starting_serial_num": starting_serial_num,
@@ -66,48 +152,34 @@ class Requester(QObject):
                 },
                 headers={
                     "Authorization": f"Bearer {self.access_token}"
-                }
+                },
+                timeout=REQUEST_TIMEOUT,
             )
-        except requests.exceptions.ConnectionError as e:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             return -1
         
         if response.status_code == 200:
             return 0
         elif response.status_code == 401:
-            self.access_token = ""
-            self.user_manager.logout()
-            self.login_requested.emit() # thread-safely call a login
+            self.unauthorized()
             return -1
         else:
             self.logger.error(f"status_code: {response.status_code}")
             raise RuntimeError("Unknown Error")
     
-    def get_length(self) -> int:
+    async def get_length(self) -> int:
         self.logger.debug("Getting length")
         if self.access_token == "":
             self.logger.error(f"user_id: {self.user_manager.user_id()}")
             raise RuntimeError("Not logged in")
         
         url = context.settings_manager.get("internal/getLengthURL")
-        try:
-            response = requests.get(url, headers={
-                "Authorization": f"Bearer {self.access_token}"
-            })
-        except requests.exceptions.ConnectionError as e:
+        data = await self.request("GET", url)
+        if data is None:
             return -1
-        
-        if response.status_code == 200:
-            return response.json()["length"]
-        elif response.status_code == 401:
-            self.access_token = ""
-            self.user_manager.logout()
-            self.login_requested.emit() # thread-safely call a login
-            return -1
-        else:
-            self.logger.error(f"status_code: {response.status_code}")
-            raise RuntimeError(f"Unknown Error")
+        return data["length"]
     
-    def get_operations(self, serial_nums: list[int]):
+    async def get_operations(self, serial_nums: list[int]):
         self.logger.debug(f"Getting operations by {serial_nums}")
         """
         The result is always ordered by serial_num ascending
@@ -117,36 +189,17 @@ class Requester(QObject):
             raise RuntimeError("Not logged in")
         
         url = context.settings_manager.get("internal/getOperationsURL")
-        try:
-            response = requests.get(
-                url,
-                json={
-                    "serial_nums": serial_nums,
-                },
-                headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                }
-            )
-        except requests.exceptions.ConnectionError as e:
+        data = await self.request("GET", url, {"serial_nums": serial_nums})
+        if data is None:
             return None
-        
-        if response.status_code == 200:
-            retval: list[Operation] = []
-            for op in response.json():
-                operation = parse_operation(op)
-                assert operation is not None
-                retval.append(operation)
-            return retval
-        elif response.status_code == 401:
-            self.access_token = ""
-            self.user_manager.logout()
-            self.login_requested.emit() # thread-safely call a login
-            return None
-        else:
-            self.logger.error(f"status_code: {response.status_code}")
-            raise RuntimeError("Unknown Error")
+        retval: list[Operation] = []
+        for op in data:
+            operation = parse_operation(op)
+            assert operation is not None
+            retval.append(operation)
+        return retval
 
-    def get_hashcodes(self, serial_nums: list[int]):
+    async def get_hashcodes(self, serial_nums: list[int]):
         self.logger.debug(f"Getting hashcodes by {serial_nums}")
         """
         The result is always ordered by serial_num ascending
@@ -156,29 +209,7 @@ class Requester(QObject):
             raise RuntimeError("Not logged in")
         
         url = context.settings_manager.get("internal/getHashcodesURL")
-        try:
-            response = requests.get(
-                url,
-                json={
-                    "serial_nums": serial_nums,
-                },
-                headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                }
-            )
-        except requests.exceptions.ConnectionError as e:
-            return None
-        
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 401:
-            self.access_token = ""
-            self.user_manager.logout()
-            self.login_requested.emit() # thread-safely call a login
-            return None
-        else:
-            self.logger.error(f"status_code: {response.status_code}")
-            raise RuntimeError("Unknown Error")
+        return await self.request("GET", url, {"serial_nums": serial_nums})
 
     def build_websocket_connection(self):
         """
@@ -222,13 +253,15 @@ class Requester(QObject):
     def login(self, username, password):
         self.logger.debug(f"logging in {username}")
         try:
-            response = requests.post(
+            response = self.sync_session.post(
                 context.settings_manager.get("internal/loginURL"),
                 json={
                     "username": username,
                     "password": password,
-            })
-        except requests.exceptions.ConnectionError as e:
+                },
+                timeout=REQUEST_TIMEOUT,
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             return -1, "Network Error"
 
         if response.status_code == 200:
@@ -32,6 +32,18 @@ DEFAULT_SETTINGS = {
     "graph/inactiveReminderDotColor": QColor(Qt.blue),
     "graph/showReminderHint": True,
 
+    "history/incrementalReload": True,
+    "history/checkpointInterval": 1000,
+    "history/maxSnapshots": 3,
+    "history/compactEncoding": False,
+    "history/columnarTree": False,
+    "history/backgroundReload": True,
+    "history/updateInterval": 50,
+    "history/storageProfile": "fast", # "fast" or "durable"
+    "history/groupCommitWindow": 20,
+    "history/sendWindow": 16,
+    "history/gcInterval": 60000, # ms between background collections, 0 to disable
+
     "internal/loginURL": "http://localhost:824/public/login/",
     "internal/healthCheckURL": "http://localhost:824/public/health/",
     "internal/overwriteURL": "http://localhost:824/history/overwrite/",
@@ -29,6 +29,7 @@ class Shell(QObject):
             self.pwd = '/'
         self.current_app.user_manager.user_change.connect(f)
         self.current_app.loader.reloaded.connect(self.reload_pwd)
+        self.current_app.loader.changed.connect(self.on_nodes_changed)
 
         self.logger = logging.getLogger(__name__)
     
@@ -36,6 +37,12 @@ class Shell(QObject):
         self.pwd_node = self.path_parser(self.pwd)
         self.current_app.main_window.tree_graph_widget.relayout_tree()
     
+    def on_nodes_changed(self, identities: list):
+        # the working directory may be moved or removed
+        pwd_node = self.path_parser(self.pwd)
+        if identity_of(pwd_node) != identity_of(self.pwd_node):
+            self.reload_pwd()
+
     def to_path(self, node: Node) -> str:
         if node.parent is None:
             return '/'
@@ -92,12 +99,10 @@ class Shell(QObject):
         current = self.current_app.loader.tree.root
         for p in parts:
             # search for node
-            for child in current.children:
-                if child.name == p:
-                    current = child
-                    break
-            else:
+            child = current.get_child(p)
+            if child is None:
                 return None
+            current = child
         return current
 
     def path_completor(self, incomplete_path: str) -> tuple[Optional[str], list[str]]:
@@ -167,4 +172,8 @@ class Shell(QObject):
                 command = command_class(*parts[1:])
                 return command.auto_complete(self)
         
-        return None, []
\ No newline at end of file
+        return None, []
+
+
+def identity_of(node: Optional[Node]) -> Optional[str]:
+    return None if node is None else node.identity
@@ -37,6 +37,9 @@ class CheckStateCommand(Command):
             self.error_signal.emit(f"Error: No such node {path}.\n")
             return -1
         self.output_signal.emit("Node state: " + str(node.status.value) + '\n')
+        if node.descendants:
+            completed = node.descendants - node.waiting_descendants
+            self.output_signal.emit(f"Progress: {completed}/{node.descendants} descendants completed ({node.progress():.0%})\n")
         return 0
     
     @override
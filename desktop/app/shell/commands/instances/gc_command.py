@@ -0,0 +1,47 @@
+from ..command_bases import Command, CommandArgsNumbers
+from sqlalchemy.exc import OperationalError
+from typing import override
+
+class GarbageCollectCommand(Command):
+    @classmethod
+    @override
+    def command_str(cls):
+        return "gc"
+    
+    @classmethod
+    @override
+    def command_help(cls):
+        return "Remove the operations no longer in the history, and compact the storage file.\n" \
+            "Usage: gc"
+    
+    @override
+    def command_arguments_numbers(self) -> CommandArgsNumbers:
+        return {
+            "arguments": {
+                "required": 0,
+                "optional": 0,
+            },
+            "options": {
+                "short": {},
+                "long": {},
+            }
+        }
+
+    @override
+    def execute(self, shell):
+        database = shell.current_app.database
+        database.flush()
+        result = database.collector.collect()
+        self.output_signal.emit(f"Removed {result.pending} pending and "
+                                f"{result.confirmed} confirmed operations.\n")
+        try:
+            reclaimed = database.collector.vacuum()
+        except OperationalError as e:
+            self.error_signal.emit(f"Failed to compact the storage file: {e}\n")
+            return 1
+        self.output_signal.emit(f"Reclaimed {reclaimed} bytes.\n")
+        return 0
+    
+    @override
+    def auto_complete(self, shell):
+        return None, []
@@ -1,5 +1,5 @@
 from ..command_bases import CommandGroup, Subcommand, CommandArgsNumbers
-from app.history.core import Operation, parse_operation
+from app.history.core import Operation, decode_operation
 from typing import override, cast
 
 class OperationCommand(CommandGroup):
@@ -74,17 +74,18 @@ class OperationListCommand(Subcommand):
         
         confirmed_head = shell.current_app.database.confirmed_history.get_head()
         length = 0 if confirmed_head is None else confirmed_head.serial_num
-        serial_nums = list(range(1, length+1))
 
-        for serial_num in serial_nums:
-            node = shell.current_app.database.confirmed_history.get_by_serial_num(serial_num)
-            assert node is not None
-            confirmed_operation = parse_operation(node.operation)
+        baseline = shell.current_app.database.confirmed_history.get_baseline()
+        if baseline is not None and baseline.serial_num > 1:
+            self.output_signal.emit(f"[1-{baseline.serial_num-1}, squashed] into the baseline at serial {baseline.serial_num}\n")
+
+        for node in shell.current_app.database.confirmed_history.iter_range(1, length):
+            confirmed_operation = decode_operation(node.operation)
             assert confirmed_operation is not None
-            self.output_signal.emit(format_operation(confirmed_operation, "c", str(serial_num)))
+            self.output_signal.emit(format_operation(confirmed_operation, "c", str(node.serial_num)))
         
         for node in shell.current_app.database.pending_queue.get_all():
-            pending_operation = parse_operation(node.operation)
+            pending_operation = decode_operation(node.operation)
             assert pending_operation is not None
             self.output_signal.emit(format_operation(pending_operation, "p"))
 
@@ -127,9 +128,119 @@ class OperationMetadataCommand(Subcommand):
             shell.current_app.database.pending_queue.metadata.starting_serial_num)) # type: ignore
         head = shell.current_app.database.confirmed_history.get_head()
         self.output_signal.emit("head_serial: {}\n".format(0 if head is None else head.serial_num))
+        baseline = shell.current_app.database.confirmed_history.get_baseline()
+        self.output_signal.emit("baseline_serial: {}\n".format(0 if baseline is None else baseline.serial_num))
+
+        return 0
+    
+    @override
+    def auto_complete(self, shell):
+        return None, []
+
+@OperationCommand.register_subcommand
+class OperationRootCommand(Subcommand):
+    @classmethod
+    @override
+    def command_str(cls):
+        return "root"
+    
+    @classmethod
+    @override
+    def command_help(cls):
+        return "Show the merkle hash of confirmed operations, which is identical\n" \
+            "on every terminal holding the same operations.\n" \
+            "Usage: rmd root [start] [end]" \
+            "\n  start, end: the range of serial nums, the whole history by default."
+    
+    @override
+    def command_arguments_numbers(self) -> CommandArgsNumbers:
+        return {
+            "arguments": {
+                "required": 0,
+                "optional": 2,
+            },
+            "options": {
+                "short": {},
+                "long": {},
+            }
+        }
+    
+    @override
+    def execute(self, shell):
+        confirmed_history = shell.current_app.database.confirmed_history
+        head = confirmed_history.get_head()
+        length = 0 if head is None else head.serial_num
+        if length == 0:
+            self.output_signal.emit("No confirmed operations.\n")
+            return 0
+        optional = self.args['arguments']['optional']
+        try:
+            start = int(optional[0]) if len(optional) > 0 else 1
+            end = int(optional[1]) if len(optional) > 1 else length
+        except ValueError:
+            self.error_signal.emit("Serial nums must be integers.\n")
+            return 1
+        if not 1 <= start <= end <= length:
+            self.error_signal.emit(f"Invalid range, confirmed serial nums are 1 to {length}.\n")
+            return 1
+
+        self.output_signal.emit(f"[{start}, {end}] {confirmed_history.index.range_hash(start, end)}\n")
+        return 0
+    
+    @override
+    def auto_complete(self, shell):
+        return None, []
+
+
+@OperationCommand.register_subcommand
+class OperationSquashCommand(Subcommand):
+    @classmethod
+    @override
+    def command_str(cls):
+        return "squash"
+    
+    @classmethod
+    @override
+    def command_help(cls):
+        return "Squash the confirmed operations before a serial num into a baseline,\n" \
+            "which holds the tree built from them. They are no longer stored or replayed.\n" \
+            "Usage: rmd squash <serial>"
+    
+    @override
+    def command_arguments_numbers(self) -> CommandArgsNumbers:
+        return {
+            "arguments": {
+                "required": 1,
+                "optional": 0,
+            },
+            "options": {
+                "short": {},
+                "long": {},
+            }
+        }
+    
+    @override
+    def execute(self, shell):
+        confirmed_history = shell.current_app.database.confirmed_history
+        head = confirmed_history.get_head()
+        length = 0 if head is None else head.serial_num
+        try:
+            serial_num = int(self.args['arguments']['required'][0])
+        except ValueError:
+            self.error_signal.emit("Serial num must be an integer.\n")
+            return 1
+        if not 1 < serial_num <= length:
+            self.error_signal.emit(f"Invalid serial num, confirmed serial nums are 1 to {length}.\n")
+            return 1
 
+        try:
+            shell.current_app.loader.squash(serial_num)
+        except ValueError as e:
+            self.error_signal.emit(f"{e}.\n")
+            return 1
+        self.output_signal.emit(f"Squashed operations before serial {serial_num}.\n")
         return 0
     
     @override
     def auto_complete(self, shell):
-        return None, []
\ No newline at end of file
+        return None, []
@@ -0,0 +1,54 @@
+from ..command_bases import Command, CommandArgsNumbers
+from app.history.database.verifier import verify_chain
+from typing import override
+
+class VerifyCommand(Command):
+    @classmethod
+    @override
+    def command_str(cls):
+        return "verify"
+    
+    @classmethod
+    @override
+    def command_help(cls):
+        return "Verify the hash chain of confirmed history.\n" \
+            "Usage: verify" \
+            "\nOptions:" \
+            "\n  -j, --jobs [num]        canonicalize operations in num processes."
+    
+    @override
+    def command_arguments_numbers(self) -> CommandArgsNumbers:
+        return {
+            "arguments": {
+                "required": 0,
+                "optional": 0,
+            },
+            "options": {
+                "short": {"-j": 1},
+                "long": {"--jobs": 1},
+            }
+        }
+
+    @override
+    def execute(self, shell):
+        jobs = "1"
+        if self.args['options']['long']['--jobs'] is not None:
+            jobs = self.args['options']['long']['--jobs'][0]
+        if self.args['options']['short']['-j'] is not None:
+            jobs = self.args['options']['short']['-j'][0]
+        if not jobs.isdigit() or int(jobs) == 0:
+            self.error_signal.emit("Number of jobs must be a positive integer.\n")
+            return 1
+
+        database = shell.current_app.database
+        database.flush()
+        result = verify_chain(database.session, int(jobs))
+        if result.corrupted is None:
+            self.output_signal.emit(result.summary() + "\n")
+            return 0
+        self.error_signal.emit(result.summary() + "\n")
+        return 1
+    
+    @override
+    def auto_complete(self, shell):
+        return None, []
@@ -0,0 +1,108 @@
+# drain time of a backlog of pending operations
+# run from the desktop directory:
+#   python -m benchmarks.drain_benchmark [count] [rtt_ms]
+# runs a local stand-in of the websocket server, which behaves like the
+# backend (drops operations not expecting its head serial num and history
+# hash, broadcasts the accepted ones), with a simulated round trip time, and measures how
+# long the sender takes to get a backlog confirmed, for several windows
+
+from app.history.database.models import Base
+from app.history.database.pending_queue import PendingQueue
+from app.history.database.confirmed_history import ConfirmedHistory
+from app.history.database.read_view import open_read_view
+from app.history.database.storage import create_storage_engine, FAST
+from app.history.core import parse_operation, canonical_form
+from app.history.syncer.sender import WebsocketSender
+from benchmarks.replay_benchmark import generate_operations
+from sqlalchemy.orm import sessionmaker
+from pathlib import Path
+import asyncio, hashlib, json, sys, tempfile, time, websockets
+
+
+class StandInServer:
+    """
+    accepts an operation only if it expects the next serial num and the
+    history hash of the head, and answers after the round trip time
+    """
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.head_serial = 0
+        self.head_hash = ""
+
+    async def handler(self, ws):
+        loop = asyncio.get_running_loop()
+        async for message in ws:
+            data = json.loads(message)
+            if data["expected_serial_num"] != self.head_serial + 1 or \
+                    data["expected_prev_hash"] != self.head_hash:
+                continue
+            self.head_serial += 1
+            self.head_hash = hashlib.sha256((self.head_hash + data["operation"]).encode('utf-8')).hexdigest()
+            reply = json.dumps({
+                "action": "update",
+                "operation": data["operation"],
+                "serial_num": self.head_serial,
+            })
+            # the whole round trip is put on the way back
+            loop.call_later(self.rtt, lambda reply=reply: asyncio.ensure_future(ws.send(reply)))
+
+
+class Storage:
+    """
+    the part of Database which the sender and the receiving side use
+    """
+    def __init__(self, path: Path):
+        self.engine = create_storage_engine(f"sqlite:///{path}", FAST)
+        Base.metadata.create_all(self.engine)
+        self.make_session = sessionmaker(bind=self.engine)
+        self.session = self.make_session()
+        self.pending_queue = PendingQueue(self.session)
+        self.confirmed_history = ConfirmedHistory(self.session)
+
+    def read_view(self):
+        return open_read_view(self.make_session())
+
+    def confirm(self, operation_str: str, serial_num: int):
+        # what Syncer.on_receive does, without the out of order case
+        operation = parse_operation(operation_str)
+        assert operation is not None
+        head = self.pending_queue.get_head()
+        if head is not None and operation_str == canonical_form(head.operation):
+            self.pending_queue.pop()
+        self.confirmed_history.insert_at_head(operation, serial_num)
+
+
+async def drain(window: int, operations, rtt: float, directory: Path) -> float:
+    storage = Storage(directory / f"window{window}.db")
+    for operation in operations:
+        storage.pending_queue.push(operation)
+
+    server = StandInServer(rtt)
+    async with websockets.serve(server.handler, "localhost", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://localhost:{port}") as ws:
+            sender = WebsocketSender(storage, ws, window) # type: ignore[arg-type]
+            start = time.perf_counter()
+            sending = asyncio.create_task(sender.start())
+            async for message in ws:
+                data = json.loads(message)
+                storage.confirm(data["operation"], data["serial_num"])
+                sender.wake()
+                if storage.pending_queue.is_empty():
+                    break
+            elapsed = time.perf_counter() - start
+            await sender.stop()
+            sending.cancel()
+    storage.session.close()
+    storage.engine.dispose()
+    return elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    operations = generate_operations(count)
+    with tempfile.TemporaryDirectory() as directory:
+        for window in (1, 4, 16, 64):
+            elapsed = asyncio.run(drain(window, operations, rtt, Path(directory)))
+            print(f"window {window:>3} {elapsed:>8.2f} s {count / elapsed:>10.0f} ops/s")
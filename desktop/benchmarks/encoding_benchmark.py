@@ -0,0 +1,46 @@
+# measurement of the storage encodings of operations
+# run from the desktop directory:
+#   python -m benchmarks.encoding_benchmark [count]
+# writes the same confirmed history in JSON and in compact binary form,
+# and reports the file size and the decode throughput of each
+
+from app.history.database.models import Base
+from app.history.database.confirmed_history import ConfirmedHistory
+from app.history.database.bulk_reader import BulkReader
+from benchmarks.replay_benchmark import generate_operations
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from pathlib import Path
+import sys, tempfile, time
+
+
+def measure(name: str, compact: bool, operations, directory: Path):
+    path = directory / f"{name}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    history = ConfirmedHistory(session, compact)
+    history.overwrite(1, operations)
+    head_hash = history.get_head().history_hash # type: ignore
+    session.close()
+    with engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+    size = path.stat().st_size
+
+    session = sessionmaker(bind=engine)()
+    reader = BulkReader(session)
+    start = time.perf_counter()
+    count = sum(1 for _ in reader.confirmed(1, len(operations)))
+    elapsed = time.perf_counter() - start
+    session.close()
+    engine.dispose()
+
+    print(f"{name:>8} {size / 1024:>10.0f} KiB {count / elapsed:>12.0f} ops/s  {head_hash[:16]}")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    operations = generate_operations(count)
+    with tempfile.TemporaryDirectory() as directory:
+        measure("json", False, operations, Path(directory))
+        measure("compact", True, operations, Path(directory))
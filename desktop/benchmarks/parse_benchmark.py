@@ -0,0 +1,34 @@
+# microbenchmark of parsing operation strings
+# run from the desktop directory:
+#   python -m benchmarks.parse_benchmark [count]
+# compares building a TypeAdapter per operation (the former behaviour)
+# with the cached validators and the trusted path
+
+from app.history.core import OperationType, parse_operation
+from app.history.core.operation import Operation, OperationPayload
+from benchmarks.replay_benchmark import generate_operations
+from pydantic import TypeAdapter
+import json, sys, time
+
+
+def parse_uncached(op_str: str):
+    data = json.loads(op_str)
+    op_type = OperationType(data["op_type"])
+    TypeAdapter(OperationPayload[data["op_type"]]).validate_python(data["payload"])
+    return Operation(op_type=op_type, payload=data["payload"], timestamp=data["timestamp"])
+
+
+def measure(name: str, parse, op_strs: list[str]):
+    start = time.perf_counter()
+    for op_str in op_strs:
+        parse(op_str)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10} {len(op_strs) / elapsed:>12.0f} ops/s")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    op_strs = [op.stringify() for op in generate_operations(count)]
+    measure("uncached", parse_uncached, op_strs)
+    measure("cached", parse_operation, op_strs)
+    measure("trusted", lambda op_str: parse_operation(op_str, trusted=True), op_strs)
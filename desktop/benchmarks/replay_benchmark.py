@@ -0,0 +1,71 @@
+# benchmark of replaying operations on a Tree
+# run from the desktop directory:
+#   python -m benchmarks.replay_benchmark [total_ops]
+# the time per operation should stay flat when the history grows,
+# which shows the replay is linear in the number of operations
+
+from app.history.core import Tree, Operation, OperationType
+import random, sys, time, uuid
+
+
+def generate_operations(count: int, seed: int = 0) -> list[Operation]:
+    """
+    generate a valid history of `count` operations,
+    mostly adding nodes, with completions, moves and removals mixed in
+    """
+    rng = random.Random(seed)
+    tree = Tree()
+    ids = [tree.root.identity]
+    operations: list[Operation] = []
+    while len(operations) < count:
+        r = rng.random()
+        if r < 0.6 or len(ids) < 10:
+            op = Operation(OperationType.ADD_NODE, {
+                "parent_node_id": rng.choice(ids),
+                "new_node_name": uuid.UUID(int=rng.getrandbits(128)).hex[:8],
+                "new_node_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+            }, timestamp=0)
+        elif r < 0.8:
+            op = Operation(OperationType.COMPLETE_NODE, {
+                "node_id": rng.choice(ids),
+            }, timestamp=0)
+        elif r < 0.9:
+            op = Operation(OperationType.MOVE_NODE, {
+                "node_id": rng.choice(ids),
+                "new_parent_id": rng.choice(ids),
+            }, timestamp=0)
+        else:
+            op = Operation(OperationType.REMOVE_NODE, {
+                "node_id": rng.choice(ids),
+            }, timestamp=0)
+
+        if op.apply(tree) != 0:
+            continue
+        operations.append(op)
+        if op.op_type == OperationType.ADD_NODE:
+            ids.append(op.payload["new_node_id"]) # type: ignore
+        elif op.op_type == OperationType.REMOVE_NODE:
+            ids.remove(op.payload["node_id"]) # type: ignore
+
+    assert tree.check_index()
+    return operations
+
+
+def replay(operations: list[Operation]) -> float:
+    tree = Tree()
+    start = time.perf_counter()
+    for op in operations:
+        code = op.apply(tree)
+        assert code == 0
+    elapsed = time.perf_counter() - start
+    assert tree.check_index()
+    return elapsed
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    operations = generate_operations(total)
+    print(f"{'ops':>10} {'seconds':>10} {'us/op':>10}")
+    for size in (total // 8, total // 4, total // 2, total):
+        elapsed = replay(operations[:size])
+        print(f"{size:>10} {elapsed:>10.3f} {elapsed / size * 1e6:>10.2f}")
@@ -0,0 +1,79 @@
+# write throughput of the storage profiles
+# run from the desktop directory:
+#   python -m benchmarks.storage_benchmark [count] [window_ms]
+# pushes operations into the pending queue of a Database and confirms
+# them, under the durable and the fast profile, and reports the
+# operations written per second; "grouped" is the fast profile with the
+# group commit of Database, whose commit timer is driven by the Qt event
+# loop, and the pushes only count once they are in the file
+
+from PyQt5.QtCore import QCoreApplication
+from app.globals import context
+from app.settings import DEFAULT_SETTINGS
+from app.user import UserManager
+from app.history.database import Database
+from app.history.database.storage import DURABLE, FAST
+from benchmarks.replay_benchmark import generate_operations
+from pathlib import Path
+import json, sys, tempfile, time
+
+
+class BenchmarkSettings:
+    """
+    the default settings with a few overridden, instead of config.ini
+    """
+    def __init__(self, overrides: dict):
+        self.overrides = overrides
+
+    def get(self, key, type=None):
+        return self.overrides.get(key, DEFAULT_SETTINGS[key])
+
+
+def committed_pending(database: Database, count: int) -> int:
+    # through another connection, which only sees committed rows
+    with database.read_view() as view:
+        return len(view.pending_window(count))
+
+
+def measure(name: str, profile: str, window: int, operations, directory: Path):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    context.settings_manager = BenchmarkSettings({
+        "history/storageProfile": profile,
+        "history/groupCommitWindow": window,
+        "history/gcInterval": 0,
+    })
+    user_file = directory / f"{name}.json"
+    user_file.write_text(json.dumps({"user_id": name, "username": name}))
+    database = Database(UserManager(user_file), directory, "storage.db")
+
+    start = time.perf_counter()
+    for operation in operations:
+        database.pending_queue.push(operation)
+        app.processEvents()
+    # wait for the commit timer instead of flushing
+    while committed_pending(database, len(operations)) < len(operations):
+        app.processEvents()
+        time.sleep(0.001)
+    push_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, operation in enumerate(operations):
+        database.confirmed_history.insert_at_head(operation, i + 1)
+        app.processEvents()
+    confirm_elapsed = time.perf_counter() - start
+
+    database.session.close()
+    database.thread_sessions.remove()
+    database.engine.dispose()
+    print(f"{name:>10} {len(operations) / push_elapsed:>10.0f} pushes/s "
+          f"{len(operations) / confirm_elapsed:>10.0f} confirms/s")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    operations = generate_operations(count)
+    with tempfile.TemporaryDirectory() as directory:
+        measure("durable", DURABLE, 0, operations, Path(directory))
+        measure("fast", FAST, 0, operations, Path(directory))
+        measure("grouped", FAST, window, operations, Path(directory))
@@ -0,0 +1,23 @@
+# verify the hash chain of a storage file without starting the app
+# usage: python verify.py <storage.db> [jobs]
+# exits with 1 if the history is corrupted
+
+import sys
+
+if __name__ == '__main__':
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app.history.database.verifier import verify_chain
+    if len(sys.argv) < 2:
+        print("usage: python verify.py <storage.db> [jobs]")
+        sys.exit(2)
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    if jobs < 1:
+        print("Number of jobs must be a positive integer.")
+        sys.exit(2)
+    # read only, it may be in use by the app
+    engine = create_engine(f"sqlite:///file:{sys.argv[1]}?mode=ro&uri=true")
+    with Session(engine) as session:
+        result = verify_chain(session, jobs)
+    print(result.summary())
+    sys.exit(0 if result.corrupted is None else 1)
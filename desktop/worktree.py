@@ -4,6 +4,9 @@ def global_exception_hook(exctype, value, tb):
     logging.error("Uncaught exception:", exc_info=(exctype, value, tb))
 
 if __name__ == '__main__':
+    # the frozen app starts the workers of verify as copies of itself
+    import multiprocessing
+    multiprocessing.freeze_support()
     from app import Application
     # from app.controls import register_app
     app = Application(sys.argv)